@@ -1,17 +1,42 @@
-from flask import Flask, render_template, request, jsonify, url_for, flash, redirect, send_file, session
+from flask import Flask, render_template, request, jsonify, url_for, flash, redirect, send_file, session, Response, stream_with_context
 import os
+import uuid
+import zipfile
 from dotenv import load_dotenv
 import json
-import pandas as pd
 from werkzeug.utils import secure_filename
-from PIL import Image
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
 from datetime import datetime
 from io import BytesIO
-from openpyxl import Workbook
-from openpyxl.worksheet.datavalidation import DataValidation
-from openpyxl.styles import PatternFill, Border, Side
 from functools import wraps
+from concurrent.futures import as_completed, wait, FIRST_COMPLETED
+from itertools import chain
+# students.json is read and written through student_data, whose store_lock
+# serializes load-modify-save cycles with imports and image workers
+from student_data import load_students, save_students, store_lock, with_store_lock
 from db import generate_otp, save_otp, verify_otp, get_student_mobile
+from excel_import import (
+    read_student_sheet,
+    normalize_student_frame,
+    merge_student_frame,
+    import_student_sheet_streaming,
+    iter_student_sheet_import,
+    import_student_workbooks
+)
+from import_jobs import submit_job, get_job
+from excel_diff import diff_student_record
+from excel_handler import export_students_to_excel, iter_students_csv, iter_students_ndjson
+from excel_template import get_template
+from photo_export import iter_photo_zip
+from upload_streaming import SpooledRequest, iter_uploaded_files
+from image_pipeline import (
+    get_image_pool, encode_profile_image, schedule_profile_image, validate_image_upload,
+    InvalidImage, UPLOAD_EXTENSIONS, thumbnail_path, cache_static_images
+)
+from thumbnails import stored_profile_image, send_variant, start_thumbnail_warmer, thumbnail_warmer_status
+from sprite_sheets import class_sprite
+from image_gc import orphan_report, enqueue_image_cleanup, enqueue_orphan_sweep, image_cleanup_status
+from photo_pack import PACK_PREFIX, packed_entry, send_packed, pack_profile_image, open_photo, pack_stats
 from twilio.rest import Client
 from flask import current_app
 
@@ -19,6 +44,7 @@ from flask import current_app
 load_dotenv()
 
 app = Flask(__name__)
+app.request_class = SpooledRequest
 
 # Add secret key for flash messages and session
 app.secret_key = os.environ.get('SECRET_KEY', 'default_secret_key_for_development')
@@ -26,29 +52,38 @@ app.config['SESSION_PERMANENT'] = False
 app.config['SESSION_TYPE'] = 'filesystem'
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 86400  # cache static files for a day
 
+# Upload limits: whole request body, single photo, and in-memory part size
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 500)) * 1024 * 1024
+app.config['MAX_IMAGE_BYTES'] = 20 * 1024 * 1024
+app.config['UPLOAD_SPOOL_MAX_MEMORY'] = 1024 * 1024
+
 # Configure upload folder
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
-# JSON storage file path
-STUDENTS_JSON = 'students.json'
+# Excel imports: sheets above this size are read in batches instead of all at once
+app.config['STREAM_IMPORT_MIN_BYTES'] = 5 * 1024 * 1024
+app.config['IMPORT_BATCH_SIZE'] = 1000
+
+# Generate thumbnails missing for existing photos in the background after startup
+app.config['WARM_THUMBNAILS_ON_START'] = True
 
-def load_students():
-    if os.path.exists(STUDENTS_JSON):
-        with open(STUDENTS_JSON, 'r') as f:
-            return json.load(f)
-    return []
+# 'pack' appends new photos to a few pack files instead of one file per photo
+app.config['PHOTO_STORE'] = os.environ.get('PHOTO_STORE', 'files')
 
-def save_students(students):
-    with open(STUDENTS_JSON, 'w') as f:
-        json.dump(students, f, indent=4)
+# What happens to images nothing refers to any more: 'quarantine' moves them
+# to uploads/quarantine, 'delete' removes them
+app.config['IMAGE_GC_MODE'] = os.environ.get('IMAGE_GC_MODE', 'quarantine')
 
 def _resolve_profile_image_internal(profile_image, roll_no):
     """Return relative static path for an existing profile image.
     Tries stored path first, then guesses by roll number with common extensions and cases.
     """
     try:
+        # Packed photos are looked up in the pack index, not on disk
+        if str(profile_image or '').startswith(PACK_PREFIX) and packed_entry(profile_image):
+            return profile_image
         static_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
         candidates = []
         if profile_image:
@@ -68,6 +103,17 @@ def _resolve_profile_image_internal(profile_image, roll_no):
 def _resolve_profile_image_thumb(profile_image, roll_no):
     try:
         static_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+        stored = str(profile_image or '').replace('\\', '/')
+        # Content-addressed photos carry their own thumbnail; older per-roll
+        # thumbnails would be stale for them and for pending raw uploads
+        if stored.startswith('uploads/cas/'):
+            thumb_cas = os.path.join(static_root, thumbnail_path(stored))
+            if os.path.exists(thumb_cas):
+                return os.path.relpath(thumb_cas, static_root).replace('\\', '/')
+        if stored.startswith(PACK_PREFIX) and packed_entry(thumbnail_path(stored)):
+            return thumbnail_path(stored)
+        if stored.startswith(('uploads/cas/', 'uploads/raw/', PACK_PREFIX)):
+            return _resolve_profile_image_internal(profile_image, roll_no)
         roll_str = (str(roll_no or '').strip())
         thumb_webp = os.path.join(static_root, 'uploads', 'thumbs', f"{roll_str.lower()}_thumb.webp")
         if os.path.exists(thumb_webp):
@@ -76,11 +122,34 @@ def _resolve_profile_image_thumb(profile_image, roll_no):
         pass
     return _resolve_profile_image_internal(profile_image, roll_no)
 
+def _class_sprite(class_name, class_students):
+    return class_sprite(class_name, class_students, _resolve_profile_image_internal)
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return jsonify({'success': False, 'error': f'Upload too large (limit {limit_mb} MB)'}), 413
+
+_thumbnail_warmer_started = False
+
+@app.before_request
+def warm_thumbnails_once():
+    # The first request kicks off the warmer; it never blocks the request
+    global _thumbnail_warmer_started
+    if not _thumbnail_warmer_started and app.config['WARM_THUMBNAILS_ON_START']:
+        _thumbnail_warmer_started = True
+        start_thumbnail_warmer(_resolve_profile_image_internal)
+
+@app.after_request
+def add_image_cache_headers(response):
+    return cache_static_images(response, request.path)
+
 @app.context_processor
 def inject_image_resolver():
     return {
         'resolve_profile_image': _resolve_profile_image_internal,
-        'resolve_profile_image_thumb': _resolve_profile_image_thumb
+        'resolve_profile_image_thumb': _resolve_profile_image_thumb,
+        'class_sprite': _class_sprite
     }
 
 def _avatar_style(name):
@@ -409,6 +478,35 @@ def admin_root_redirect():
 def admin_dashboard():
     return render_template('student_form.html')
 
+@app.route('/admin/thumbnails', methods=['GET'])
+@admin_login_required
+def thumbnail_warmer_progress():
+    """Progress of the background thumbnail warmer"""
+    return jsonify(thumbnail_warmer_status()), 200
+
+@app.route('/admin/thumbnails', methods=['POST'])
+@admin_login_required
+def warm_thumbnails():
+    """Start another thumbnail warming pass unless one is running"""
+    started = start_thumbnail_warmer(_resolve_profile_image_internal)
+    return jsonify({'started': started, **thumbnail_warmer_status()}), 202 if started else 200
+
+@app.route('/admin/images/orphans', methods=['GET'])
+@admin_login_required
+def image_orphans():
+    """Images no student or sprite sheet refers to, with their sizes, and cleanup progress"""
+    return jsonify({'orphans': orphan_report(_resolve_profile_image_internal), 'cleanup': image_cleanup_status()}), 200
+
+@app.route('/admin/images/orphans', methods=['POST'])
+@admin_login_required
+def collect_image_orphans():
+    """Delete or quarantine orphaned images in the background (?mode=delete|quarantine)"""
+    mode = request.args.get('mode') or app.config['IMAGE_GC_MODE']
+    if mode not in ('delete', 'quarantine'):
+        return jsonify({'success': False, 'message': 'mode must be delete or quarantine'}), 400
+    enqueue_orphan_sweep(_resolve_profile_image_internal, mode)
+    return jsonify({'success': True, 'mode': mode, **image_cleanup_status()}), 202
+
 @app.route('/search_barcode', methods=['POST'])
 def search_barcode():
     try:
@@ -479,54 +577,15 @@ def submit():
         
         print("Received student data:", student_data)  # Debug print
         
-        # Handle profile image upload
-        if 'profileImage' in request.files:
-            profile_image = request.files['profileImage']
-            if profile_image and profile_image.filename:
-                # Only process if roll number is provided
-                if 'rollNo' in student_data and student_data['rollNo']:
-                    # Get file extension
-                    filename = secure_filename(profile_image.filename)
-                    file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'jpg'
-                    
-                    # Create new filename using roll number
-                    new_filename = f"{str(student_data['rollNo']).strip().lower()}.{file_ext}"
-                    
-                    # Ensure upload directory exists
-                    upload_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
-                    if not os.path.exists(upload_path):
-                        os.makedirs(upload_path)
-                    
-                    # Save file with compression
-                    # Save main as WEBP
-                    new_filename = f"{str(student_data['rollNo']).strip().lower()}.webp"
-                    file_path = os.path.join(upload_path, new_filename)
-                    try:
-                        profile_image.stream.seek(0)
-                        with Image.open(profile_image.stream) as img:
-                            if img.mode in ("P", "RGBA"):
-                                img = img.convert("RGB")
-                            max_size = (800, 800)
-                            img.thumbnail(max_size, Image.LANCZOS)
-                            img.save(file_path, format='WEBP', quality=80, method=6)
-                            # Generate WebP thumbnail
-                            try:
-                                thumb_dir = os.path.join(upload_path, 'thumbs')
-                                if not os.path.exists(thumb_dir):
-                                    os.makedirs(thumb_dir)
-                                thumb_path = os.path.join(thumb_dir, f"{str(student_data['rollNo']).strip().lower()}_thumb.webp")
-                                thumb = img.copy()
-                                thumb.thumbnail((256, 256), Image.LANCZOS)
-                                thumb.save(thumb_path, format='WEBP', quality=75, method=6)
-                            except Exception:
-                                pass
-                    except Exception:
-                        profile_image.stream.seek(0)
-                        profile_image.save(file_path)
-                    
-                    # Store the relative path in student data
-                    student_data['profileImage'] = f"uploads/{new_filename}"
-                    print(f"Set profile image path to: {student_data['profileImage']}")
+        # Handle profile image upload; it is stored once the record is valid
+        profile_image = request.files.get('profileImage')
+        if profile_image and profile_image.filename:
+            try:
+                validate_image_upload(profile_image)
+            except InvalidImage as e:
+                return jsonify({'error': str(e)}), 400
+        else:
+            profile_image = None
         
         # Remove None and empty string values
         student_data = {k: v for k, v in student_data.items() if v is not None and v != ''}
@@ -538,27 +597,33 @@ def submit():
             return jsonify({'error': 'Roll number is required'}), 400
 
         try:
-            # Check for duplicates before saving
-            students = load_students()
+            with store_lock:
+                # Check for duplicates before saving
+                students = load_students()
             
-            # First check if document with this roll number already exists
-            if any(s.get('rollNo') == student_data['rollNo'] for s in students):
-                return jsonify({
-                    'error': f'Student with Roll Number {student_data["rollNo"]} already exists!'
-                }), 409
-
-            # Check for duplicate registration number if provided
-            if student_data.get('regNo') and any(s.get('regNo') == student_data['regNo'] for s in students):
-                return jsonify({
-                    'error': f'Student with Registration Number {student_data["regNo"]} already exists!'
-                }), 409
-
-            # Add timestamp
-            student_data['createdAt'] = datetime.now().isoformat()
+                # First check if document with this roll number already exists
+                if any(s.get('rollNo') == student_data['rollNo'] for s in students):
+                    return jsonify({
+                        'error': f'Student with Roll Number {student_data["rollNo"]} already exists!'
+                    }), 409
+
+                # Check for duplicate registration number if provided
+                if student_data.get('regNo') and any(s.get('regNo') == student_data['regNo'] for s in students):
+                    return jsonify({
+                        'error': f'Student with Registration Number {student_data["regNo"]} already exists!'
+                    }), 409
+
+                # Store the upload as-is; the WebP encode runs in the background
+                if profile_image:
+                    student_data['profileImage'] = schedule_profile_image(profile_image, student_data['rollNo'])
+                    print(f"Set profile image path to: {student_data['profileImage']}")
+
+                # Add timestamp
+                student_data['createdAt'] = datetime.now().isoformat()
             
-            # Save to JSON
-            students.append(student_data)
-            save_students(students)
+                # Save to JSON
+                students.append(student_data)
+                save_students(students)
             print(f"New student data saved for roll number: {student_data['rollNo']}")
             
             return jsonify({
@@ -775,70 +840,34 @@ def edit_student(student_id):
                 profile_image = request.files['profileImage']
                 print(f"Profile image file: {profile_image}, filename: {profile_image.filename}")
                 if profile_image and profile_image.filename:
-                    # Get file extension
-                    filename = secure_filename(profile_image.filename)
-                    file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'jpg'
-                    
-                    # Create new filename using student ID (roll number)
-                    new_filename = f"{str(student_id).strip().lower()}.{file_ext}"
-                    
-                    # Ensure upload directory exists
-                    upload_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
-                    if not os.path.exists(upload_path):
-                        os.makedirs(upload_path)
-                    
-                    # Save file with compression
-                    # Save main as WEBP
-                    new_filename = f"{str(student_id).strip().lower()}.webp"
-                    file_path = os.path.join(upload_path, new_filename)
-                    print(f"Saving profile image to: {file_path}")
+                    # Store the upload as-is; the WebP encode runs in the background
                     try:
-                        profile_image.stream.seek(0)
-                        with Image.open(profile_image.stream) as img:
-                            if img.mode in ("P", "RGBA"):
-                                img = img.convert("RGB")
-                            max_size = (800, 800)
-                            img.thumbnail(max_size, Image.LANCZOS)
-                            img.save(file_path, format='WEBP', quality=80, method=6)
-                            # Generate WebP thumbnail
-                            try:
-                                thumb_dir = os.path.join(upload_path, 'thumbs')
-                                if not os.path.exists(thumb_dir):
-                                    os.makedirs(thumb_dir)
-                                thumb_path = os.path.join(thumb_dir, f"{str(student_id).strip().lower()}_thumb.webp")
-                                thumb = img.copy()
-                                thumb.thumbnail((256, 256), Image.LANCZOS)
-                                thumb.save(thumb_path, format='WEBP', quality=75, method=6)
-                            except Exception:
-                                pass
-                    except Exception:
-                        profile_image.stream.seek(0)
-                        profile_image.save(file_path)
-                    print(f"Saved profile image to {file_path}")
-                    
-                    # Store the relative path in student data
-                    updated_data['profileImage'] = f"uploads/{new_filename}"
+                        updated_data['profileImage'] = schedule_profile_image(profile_image, student_id)
+                    except InvalidImage as e:
+                        flash(str(e), 'error')
+                        return redirect(url_for('edit_student', student_id=student_id))
                     print(f"Set profile image path to: {updated_data['profileImage']}")
                 
             # Remove None and empty string values
             updated_data = {k: v for k, v in updated_data.items() if v is not None and v != ''}
             
-            # Update the student in the JSON file
-            students = load_students()
+            with store_lock:
+                # Update the student in the JSON file
+                students = load_students()
             
-            # Find the student by ID (roll number)
-            student_index = next((i for i, s in enumerate(students) if s.get('rollNo') == student_id), None)
+                # Find the student by ID (roll number)
+                student_index = next((i for i, s in enumerate(students) if s.get('rollNo') == student_id), None)
             
-            if student_index is not None:
-                # Update the student data
-                students[student_index].update(updated_data)
+                if student_index is not None:
+                    # Update the student data
+                    students[student_index].update(updated_data)
                 
-                # Save the updated students list
-                save_students(students)
+                    # Save the updated students list
+                    save_students(students)
                 
-                flash('Student data updated successfully!', 'success')
-            else:
-                flash(f'Student with ID {student_id} not found', 'error')
+                    flash('Student data updated successfully!', 'success')
+                else:
+                    flash(f'Student with ID {student_id} not found', 'error')
                 
             return redirect(url_for('manage_students'))
 
@@ -848,6 +877,7 @@ def edit_student(student_id):
         return redirect(url_for('manage_students'))
 
 @app.route('/delete_student/<student_id>', methods=['DELETE'])
+@with_store_lock
 def delete_student(student_id):
     try:
         students = load_students()
@@ -864,6 +894,7 @@ def delete_student(student_id):
         
         # Save updated students
         save_students(students)
+        enqueue_image_cleanup([student], _resolve_profile_image_internal, app.config['IMAGE_GC_MODE'])
         
         return jsonify({
             'success': True,
@@ -878,6 +909,44 @@ def delete_student(student_id):
             'error': str(e)
         }), 500
 
+def _run_upload_job(filepath, progress):
+    """Background runner for /upload?async: streaming import with progress"""
+    report = import_student_sheet_streaming(filepath, app.config['IMPORT_BATCH_SIZE'], progress)
+    report['message'] = _upload_message(report['total'], report, report['errors'])
+    return report
+
+def _upload_message(total, counts, error_count):
+    return (f"Processed {total} rows: {counts['inserted']} inserted, {counts['updated']} updated, "
+            f"{counts['unchanged']} unchanged and {error_count} issues.")
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Progress and final report of a background import job"""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job), 200
+
+def _upload_report(filepath, reports):
+    """NDJSON lines for the reports of iter_student_sheet_import; removes the file when done"""
+    try:
+        for report in reports:
+            if report.get('summary'):
+                counts = {key: report[key] for key in ('inserted', 'updated', 'unchanged')}
+                report = {
+                    'summary': True,
+                    'success': True,
+                    'message': _upload_message(report['total'], counts, report['errors']),
+                    'stats': {key: value for key, value in report.items() if key != 'summary'}
+                }
+            yield json.dumps(report) + '\n'
+    except Exception as e:
+        print(f"Error in upload report: {str(e)}")
+        yield json.dumps({'summary': True, 'success': False, 'error': f'Error processing Excel file: {str(e)}'}) + '\n'
+    finally:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     try:
@@ -894,152 +963,97 @@ def upload_file():
             os.makedirs(app.config['UPLOAD_FOLDER'])
         
         filename = secure_filename(file.filename)
+        
+        # Queue the import in the background and let the client poll /jobs/<id>
+        if request.form.get('async') == 'true':
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
+            file.save(filepath)
+            job = submit_job('upload', filepath, _run_upload_job, file_name=filename)
+            return jsonify({
+                'success': True,
+                'jobId': job['id'],
+                'status': job['status'],
+                'reused': job['reused'],
+                'statusUrl': url_for('job_status', job_id=job['id'])
+            }), 202
+        
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
         
-        try:
-            # Read Excel file
-            df = pd.read_excel(filepath,dtype={'Student Contact': str, 'Parent No': str})
-            if df.empty:
+        # Opt-in: stream a line per row as each batch is committed
+        if _wants_ndjson():
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
+            file.save(filepath)
+
+            # Import the first batch before answering, so an unreadable or
+            # empty sheet still gets a 400 rather than a 200 with an error line
+            reports = iter_student_sheet_import(filepath, app.config['IMPORT_BATCH_SIZE'])
+            try:
+                first = next(reports)
+            except Exception as e:
+                os.remove(filepath)
+                return jsonify({'error': f'Error processing Excel file: {str(e)}'}), 400
+            if first.get('summary') and first['total'] == 0:
                 os.remove(filepath)
                 return jsonify({'error': 'Excel file is empty'}), 400
+            report = _upload_report(filepath, chain([first], reports))
+            return Response(stream_with_context(report), mimetype='application/x-ndjson')
+        
+        file.save(filepath)
+        
+        try:
+            # Large sheets (or an explicit request) are imported batch by batch
+            stream_import = (request.form.get('mode') == 'stream' or
+                             os.path.getsize(filepath) > app.config['STREAM_IMPORT_MIN_BYTES'])
             
-            print("Excel columns:", df.columns.tolist())
-            
-            # Column mapping for Excel to database fields
-            column_mapping = {
-                # Basic Info
-                'Roll No': 'rollNo',
-                'Reg No': 'regNo',
-                'Section': 'classSection',
-                'Student Name': 'studentName',
-                'Father Name': 'fatherName',
-                'Gender': 'gender',
-                'DOB': 'dob',
+            if stream_import:
+                report = import_student_sheet_streaming(filepath, app.config['IMPORT_BATCH_SIZE'])
+                os.remove(filepath)
+                if report['total'] == 0:
+                    return jsonify({'error': 'Excel file is empty'}), 400
                 
-                # Contact Info
-                'Email': 'email',
-                'Address': 'address',
-                'Student Contact': 'studentContact',
-                'Parent No': 'studentContact',
+                total = report['total']
+                counts = {key: report[key] for key in ('inserted', 'updated', 'unchanged')}
+                error_messages = report['error_messages']
+            else:
+                # Read Excel file
+                df = read_student_sheet(filepath)
+                if df.empty:
+                    os.remove(filepath)
+                    return jsonify({'error': 'Excel file is empty'}), 400
                 
-                # Personal Info
-                'Aadhar No': 'aadharNo',
-                'Blood Group': 'bloodGroup',
-                'State': 'state',
-                'District': 'district',
-                'Religion': 'religion',
-                'Category': 'category',
-                'Caste': 'caste',
-                'Income': 'income',
-                'Category Applied': 'categoryApplied',
+                print("Excel columns:", df.columns.tolist())
                 
-                # PUC Details
-                'PUC/Equivalent Roll No': 'pucRollNo',
-                'PUC/Equivalent Year of Completion': 'pucYear',
-                'PUC/Equivalent Institute Name': 'pucInstitute',
-                'PUC/Equivalent Total Marks': 'pucTotalMarks',
-                'PUC/Equivalent Obtained Marks': 'pucObtainedMarks',
-                'PUC/Equivalent Percentage/CGPA': 'pucPercentage',
+                # Map columns and normalize empty cells for the whole sheet at once
+                frame = normalize_student_frame(df)
                 
-                # Program Details
-                'Program Name': 'programName',
-                'Discipline 1': 'discipline1',
-                'Language2': 'lang2',
+                with store_lock:
+                    # Load existing students
+                    students = load_students()
+                    print(f"Loaded {len(students)} existing students")
                 
-                # ABC ID Details
-                'ABC ID': 'abcId'
-            }
-            
-            success_count = 0
-            error_count = 0
-            error_messages = []
-
-            df['Student Contact'] = df['Student Contact'].str.replace(r'\.0$', '', regex=True)
-            df['Parent No'] = df['Parent No'].str.replace(r'\.0$', '', regex=True)
-
-            
-            # Load existing students
-            students = load_students()
-            print(f"Loaded {len(students)} existing students")
-            
-            # Process each row
-            for index, row in df.iterrows():
-                try:
-                    # Initialize student data with default values
-                    student_data = {
-                        'classSection': 'N/A',
-                        'collegeName': 'N/A',
-                        'programName': 'N/A',
-                        'discipline1': 'N/A',
-                        'lang2': 'N/A',
-                        'studentContact': 'N/A',
-                        'email': 'N/A',
-                        'pucRollNo': 'N/A',
-                        'pucYear': 'N/A',
-                        'pucInstitute': 'N/A',
-                        'pucTotalMarks': '0',
-                        'pucObtainedMarks': '0',
-                        'pucPercentage': '0',
-                        'abcId': 'N/A',
-                        'abcIdCollected': 'No'
-                    }
-                    
-                    # Map Excel columns to student fields
-                    for col in df.columns:
-                        if col in column_mapping:
-                            value = row[col]
-                            if pd.notna(value):  # Check if value is not NaN
-                                value = str(value).strip()
-                                if value.upper() not in ['NA', 'N/A', 'NULL', 'NONE', '', '-', 'EMPTY']:
-                                    db_field = column_mapping.get(col)
-                                    if db_field:
-                                        student_data[db_field] = value
-                    
-                    # Validate required fields
-                    if not student_data.get('rollNo'):
-                        error_messages.append(f"Row {index + 2}: Missing Roll Number")
-                        error_count += 1
-                        continue
-                    
-                    # Check if student exists
-                    student_exists = False
-                    for i, student in enumerate(students):
-                        if student['rollNo'] == student_data['rollNo']:
-                            # Update existing student
-                            students[i] = {**student, **student_data}
-                            student_exists = True
-                            print(f"Updated existing student: {student_data['rollNo']}")
-                            break
-                    
-                    if not student_exists:
-                        # Add new student
-                        student_data['createdAt'] = datetime.now().isoformat()
-                        students.append(student_data)
-                        print(f"Added new student: {student_data['rollNo']}")
-                    
-                    success_count += 1
-                    
-                except Exception as e:
-                    error_messages.append(f"Row {index + 2}: {str(e)}")
-                    error_count += 1
-                    print(f"Error in row {index + 2}: {str(e)}")
-            
-            # Save all students at once
-            save_students(students)
-            print(f"Saved {len(students)} total students")
+                    # Merge rows into the student list keyed on roll number
+                    counts, error_messages = merge_student_frame(students, frame)
+                
+                    # Save all students at once, and only if something changed
+                    if counts['inserted'] or counts['updated']:
+                        save_students(students)
+                        print(f"Saved {len(students)} total students")
+                
+                # Clean up
+                os.remove(filepath)
+                total = len(df)
             
-            # Clean up
-            os.remove(filepath)
+            error_count = len(error_messages)
             
             # Return appropriate message based on operation type
             return jsonify({
                 'success': True,
-                'message': f'Processed {len(df)} rows with {success_count} successes and {error_count} issues.',
+                'message': _upload_message(total, counts, error_count),
                 'stats': {
-                    'total': len(df),
-                    'success': success_count,
-                    'errors': error_count
+                    'total': total,
+                    'success': sum(counts.values()),
+                    'errors': error_count,
+                    **counts
                 },
                 'error_messages': error_messages
             })
@@ -1049,10 +1063,136 @@ def upload_file():
                 os.remove(filepath)
             return jsonify({'error': f'Error processing Excel file: {str(e)}'}), 500
             
+    except HTTPException:
+        # Oversized or malformed bodies get their own status
+        raise
     except Exception as e:
         return jsonify({'error': f'Error handling file upload: {str(e)}'}), 500
 
+@app.route('/export', methods=['GET'])
+def export_students():
+    """Export students as Excel (default), CSV or NDJSON.
+
+    Optional query args: class=<classSection>, columns=<comma separated fields>,
+    download=true to receive the xlsx file instead of its path.
+    """
+    try:
+        export_format = request.args.get('format', 'xlsx').lower()
+        class_section = request.args.get('class') or None
+        columns = [c.strip() for c in request.args.get('columns', '').split(',') if c.strip()] or None
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        
+        # CSV and NDJSON are streamed straight from the store
+        if export_format in ('csv', 'ndjson'):
+            if export_format == 'csv':
+                body, mimetype = iter_students_csv(columns, class_section), 'text/csv'
+            else:
+                body, mimetype = iter_students_ndjson(columns, class_section), 'application/x-ndjson'
+            return Response(body, mimetype=mimetype, headers={
+                'Content-Disposition': f'attachment; filename=students_export_{timestamp}.{export_format}'
+            })
+        
+        output_path = os.path.join(app.config['UPLOAD_FOLDER'], f"students_export_{timestamp}.xlsx")
+        
+        result = export_students_to_excel(output_path, columns, class_section)
+        
+        if not result['success']:
+            return jsonify(result), 400
+        if request.args.get('download') == 'true':
+            return send_file(result['file_path'], as_attachment=True,
+                             download_name=os.path.basename(result['file_path']))
+        return jsonify(result), 200
+
+    except Exception as e:
+        print(f"Error in export_students: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/export_photos', methods=['GET'])
+def export_photos():
+    """Stream a ZIP of student photos named by roll number.
+
+    Optional query arg: class=<classSection>. The archive is built while it
+    is sent, so nothing is written to disk; students without a photo are
+    listed in missing.txt.
+    """
+    class_section = request.args.get('class') or None
+    students = [s for s in load_students() if class_section is None or s.get('classSection') == class_section]
+    if not students:
+        return jsonify({'success': False, 'message': 'No students found'}), 404
+    
+    missing = []
+    
+    def entries():
+        for student in students:
+            roll_no = str(student.get('rollNo') or '').strip()
+            if not roll_no:
+                continue
+            photo = _resolve_profile_image_internal(student.get('profileImage'), roll_no)
+            if photo:
+                yield f"{roll_no}{os.path.splitext(photo)[1].lower()}", photo
+            else:
+                missing.append(roll_no)
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    name = secure_filename(class_section or 'all') or 'class'
+    return Response(iter_photo_zip(entries(), missing, open_photo), mimetype='application/zip', headers={
+        'Content-Disposition': f'attachment; filename=photos_{name}_{timestamp}.zip'
+    })
+
+@app.route('/upload_multi', methods=['POST'])
+def upload_multiple_files():
+    """Import several workbooks at once, optionally every sheet of each"""
+    saved = []
+    try:
+        files = [f for f in request.files.getlist('files') if f and f.filename]
+        if not files:
+            return jsonify({'error': 'No files provided'}), 400
+        if any(not f.filename.endswith('.xlsx') for f in files):
+            return jsonify({'error': 'Only .xlsx files are allowed'}), 400
+        
+        if not os.path.exists(app.config['UPLOAD_FOLDER']):
+            os.makedirs(app.config['UPLOAD_FOLDER'])
+        
+        for file in files:
+            filename = secure_filename(file.filename)
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
+            file.save(filepath)
+            saved.append((filepath, filename))
+        
+        all_sheets = request.form.get('allSheets') == 'true'
+        report = import_student_workbooks(saved, all_sheets)
+        
+        counts = {key: report[key] for key in ('inserted', 'updated', 'unchanged')}
+        message = _upload_message(report['total'], counts, report['errors'])
+        if report['conflicts']:
+            message += f" {len(report['conflicts'])} roll numbers conflict between sources and were not imported."
+        
+        return jsonify({
+            'success': True,
+            'message': message,
+            'stats': {
+                'files': len(saved),
+                'sheets': report['sheets'],
+                'total': report['total'],
+                'success': sum(counts.values()),
+                'errors': report['errors'],
+                'conflicts': len(report['conflicts']),
+                **counts
+            },
+            'error_messages': report['error_messages'],
+            'conflicts': report['conflicts']
+        })
+        
+    except Exception as e:
+        print(f"Error in upload_multiple_files: {str(e)}")
+        return jsonify({'error': f'Error processing Excel files: {str(e)}'}), 500
+    finally:
+        for filepath, _ in saved:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+
 @app.route('/delete_class/<class_section>', methods=['DELETE'])
+@with_store_lock
 def delete_class(class_section):
     try:
         if not class_section:
@@ -1076,6 +1216,7 @@ def delete_class(class_section):
             
             # Save updated students
             save_students(students_filtered)
+            enqueue_image_cleanup(students_to_delete, _resolve_profile_image_internal, app.config['IMAGE_GC_MODE'])
             
             deleted_count = len(students_to_delete)
             return jsonify({
@@ -1098,6 +1239,7 @@ def delete_class(class_section):
         }), 500
 
 @app.route('/edit_class/<class_section>', methods=['PUT'])
+@with_store_lock
 def edit_class(class_section):
     try:
         if not class_section:
@@ -1217,18 +1359,13 @@ def compare_student_data():
             
         # Compare fields and find differences
         differences = {}
-        for field, excel_value in excel_data.items():
-            if field in student:
-                db_value = str(student[field]).strip()
-                excel_value = str(excel_value).strip()
-                
-                # Skip empty or matching values
-                if excel_value and excel_value != 'Empty' and excel_value != db_value:
-                    differences[field] = {
-                        'database': db_value,
-                        'excel': excel_value,
-                        'field_name': field.replace('_', ' ').title()  # Format field name for display
-                    }
+        for change in diff_student_record(excel_data, student):
+            field = change['field']
+            differences[field] = {
+                'database': change['db_value'],
+                'excel': change['excel_value'],
+                'field_name': field.replace('_', ' ').title()  # Format field name for display
+            }
         
         # Return comparison results with student info
         return jsonify({
@@ -1247,6 +1384,7 @@ def compare_student_data():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/update_student_data', methods=['POST'])
+@with_store_lock
 def update_student_data():
     try:
         data = request.json
@@ -1288,51 +1426,16 @@ def update_student_data():
 @app.route('/download_template')
 def download_template():
     try:
-        # Create a new workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Student Data Template"
-
-        # Define headers
-        headers = [
-            'Roll No', 'Reg No', 'Section', 'Student Name', 'Father Name', 'Gender', 'DOB',
-            'Email', 'Address', 'Student Contact', 'Parent No', 'Aadhar No', 'Blood Group',
-            'State', 'District', 'Religion', 'Category', 'Caste', 'Income', 'Category Applied',
-            'PUC/Equivalent Roll No', 'PUC/Equivalent Year of Completion', 'PUC/Equivalent Institute Name',
-            'PUC/Equivalent Total Marks', 'PUC/Equivalent Obtained Marks', 'PUC/Equivalent Percentage/CGPA',
-            'Program Name', 'Discipline 1', 'Language2', 'ABC ID'
-        ]
-
-        # Add headers to worksheet
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-            cell.border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
-
-        # Add data validation for specific columns
-        gender_validation = DataValidation(
-            type="list",
-            formula1='"Male,Female,Other"',
-            allow_blank=True
-        )
-        ws.add_data_validation(gender_validation)
-        gender_validation.add(f"F2:F1000")  # Apply to Gender column
-
-        # Save to BytesIO object
-        excel_file = BytesIO()
-        wb.save(excel_file)
-        excel_file.seek(0)
+        # Prebuilt template, rebuilt only when its version or drop-down lists change
+        data, etag = get_template()
 
         return send_file(
-            excel_file,
+            BytesIO(data),
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
             as_attachment=True,
-            download_name='student_template.xlsx'
+            download_name='student_template.xlsx',
+            etag=etag,
+            max_age=0
         )
 
     except Exception as e:
@@ -1359,7 +1462,7 @@ def debug_profile_images():
             # Check if file exists on disk
             if info['hasProfileImage'] and info['profileImagePath']:
                 full_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', student['profileImage'])
-                info['fileExists'] = os.path.exists(full_path)
+                info['fileExists'] = os.path.exists(full_path) or packed_entry(student['profileImage']) is not None
                 info['fullPath'] = full_path
             else:
                 info['fileExists'] = False
@@ -1378,124 +1481,209 @@ def debug_profile_images():
             'total_students': len(image_info),
             'image_info': image_info,
             'upload_folder': upload_folder,
-            'files_in_upload_folder': files_in_folder
+            'files_in_upload_folder': files_in_folder,
+            'packs': pack_stats()
         }), 200
         
     except Exception as e:
         print(f"Error in debug_profile_images: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/static/packs/<name>', methods=['GET'])
+def packed_image(name):
+    """Serve a photo stored in the pack files (PHOTO_STORE=pack)"""
+    return send_packed(name)
+
+@app.route('/img/<roll_no>', methods=['GET'])
+def profile_image_variant(roll_no):
+    """Serve a student's photo resized to ?w=64|128|256, generated on first use"""
+    source = _resolve_profile_image_internal(stored_profile_image(roll_no), roll_no)
+    if not source:
+        return redirect(url_for('static', filename='default.jpg'))
+    try:
+        return send_variant(source, request.args.get('w', type=int))
+    except Exception as e:
+        # Photos Pillow cannot read are served as stored
+        print(f"Error in profile_image_variant: {str(e)}")
+        return redirect(url_for('static', filename=source))
+
+def _encode_uploaded_photos(items, student_roll_numbers):
+    """Encode uploaded photos on the image pool as they come in.
+
+    items yields (filename, file) pairs; file may instead be an exception
+    saying why the upload was rejected. The filename without extension must
+    match a roll number. Yields ('success' | 'error', result) per file in
+    completion order, with only a few photos waiting for a worker at a time.
+    The caller records the returned image paths on the students.
+    """
+    pool = get_image_pool()
+    pending = {}
+    max_pending = 2 * (os.cpu_count() or 1)
+
+    def collect(futures):
+        for future in futures:
+            original_filename, matching_roll = pending.pop(future)
+            try:
+                image_rel_path = future.result()
+                if app.config['PHOTO_STORE'] == 'pack':
+                    image_rel_path = pack_profile_image(matching_roll, image_rel_path)
+                yield 'success', {
+                    'original_filename': original_filename,
+                    'roll_number': matching_roll,
+                    'new_filename': os.path.basename(image_rel_path),
+                    'image_path': image_rel_path
+                }
+            except Exception as e:
+                yield 'error', {'filename': original_filename, 'error': str(e)}
+
+    for filename, file in items:
+        # Get the original filename and extract roll number
+        original_filename = secure_filename(filename)
+
+        # The filename without extension must match an existing roll number
+        matching_roll = os.path.splitext(original_filename)[0].lower()
+        file_ext = os.path.splitext(original_filename)[1].lower()
+
+        # Every spooled upload is closed here, whether it is used or not
+        error = None
+        try:
+            if matching_roll not in student_roll_numbers:
+                error = f'No student found with roll number matching filename: {matching_roll}'
+            elif isinstance(file, Exception):
+                error = str(file)
+            elif file_ext not in UPLOAD_EXTENSIONS:
+                error = f"Unsupported image type '{file_ext or original_filename}'"
+            else:
+                data = file.read()
+        finally:
+            if not isinstance(file, Exception):
+                file.close()
+        if error:
+            yield 'error', {'filename': original_filename, 'error': error}
+            continue
+
+        # The admin waits for the whole batch, so use the fast encoder
+        future = pool.submit(encode_profile_image, data, 'interactive')
+        pending[future] = (original_filename, matching_roll)
+
+        # Bound the photos held in memory while waiting for a worker
+        if len(pending) >= max_pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from collect(done)
+
+    # Collect the remaining results as workers finish
+    yield from collect(as_completed(list(pending)))
+
+def _wants_ndjson():
+    """Clients opt in to streamed NDJSON progress with ?stream=ndjson or an Accept header"""
+    return (request.args.get('stream') == 'ndjson' or
+            request.accept_mimetypes.best == 'application/x-ndjson')
+
+def _check_content_length():
+    """Answer 413 for a body over MAX_CONTENT_LENGTH before anything is streamed.
+
+    Streamed reports read the body after the view has returned, when the
+    status line has already gone out as 200.
+    """
+    limit = app.config['MAX_CONTENT_LENGTH']
+    if limit is not None and request.content_length is not None and request.content_length > limit:
+        raise RequestEntityTooLarge()
+
+def _record_photos(photos):
+    """Point students at their new photos ({roll number: path}) with one store write"""
+    with store_lock:
+        students = load_students()
+        for student in students:
+            roll = str(student.get('rollNo', '')).strip().lower()
+            if roll in photos:
+                student['profileImage'] = photos[roll]
+        save_students(students)
+
+def _photo_report(items, student_roll_numbers, cleanup=None):
+    """NDJSON report for _encode_uploaded_photos.
+
+    Yields one line per photo as it finishes, then a summary line. New photo
+    paths are written to the store once at the end; cleanup runs when the
+    photos have been processed.
+    """
+    photos = {}
+    errors = 0
+    try:
+        for status, result in _encode_uploaded_photos(items, student_roll_numbers):
+            if status == 'success':
+                photos[result['roll_number']] = result['image_path']
+            else:
+                errors += 1
+            yield json.dumps({'status': status, **result}) + '\n'
+    except Exception as e:
+        # Headers are already sent, so report the failure in the stream
+        print(f"Error in photo report: {str(e)}")
+        yield json.dumps({'summary': True, 'success': False, 'error': str(e)}) + '\n'
+        return
+    finally:
+        if cleanup:
+            cleanup()
+
+        # Record all new photos with a single store write
+        if photos:
+            _record_photos(photos)
+
+    yield json.dumps({
+        'summary': True,
+        'success': True,
+        'processed': len(photos),
+        'errors': errors,
+        'message': f"Successfully processed {len(photos)} images with {errors} errors"
+    }) + '\n'
+
 @app.route('/bulk_image_upload', methods=['POST'])
 def bulk_image_upload():
-    """Handle bulk upload of student profile images"""
+    """Handle bulk upload of student profile images
+
+    Files are read from the request body one by one and handed to the image
+    pool as soon as each has arrived, with only a few waiting at a time.
+    With ?stream=ndjson the results are streamed as they finish.
+    """
     try:
-        # Check if any files were uploaded
-        if 'images' not in request.files:
-            return jsonify({'error': 'No files provided'}), 400
-            
-        uploaded_files = request.files.getlist('images')
-        if len(uploaded_files) == 0:
-            return jsonify({'error': 'No files selected'}), 400
-            
+        _check_content_length()
+
         # Load all students to match roll numbers
-        students = load_students()
-        student_roll_numbers = {student.get('rollNo', '').lower(): student for student in students}
+        student_roll_numbers = {str(s.get('rollNo', '')).strip().lower() for s in load_students()}
         
-        # Set up upload folder
-        upload_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
-        if not os.path.exists(upload_path):
-            os.makedirs(upload_path)
-            
         results = {
             'success': [],
             'errors': []
         }
+
+        def uploaded_images():
+            for field, filename, file in iter_uploaded_files(request, max_file_size=app.config['MAX_IMAGE_BYTES']):
+                if field == 'images' and filename:
+                    yield filename, file
+
+        # Wait for the first photo, so a malformed or empty upload still gets
+        # its own status before a streamed report starts
+        images = uploaded_images()
+        first = next(images, None)
+        if first is None:
+            return jsonify({'error': 'No files provided'}), 400
+        images = chain([first], images)
+
+        # Opt-in: report each photo as it finishes instead of one final blob
+        if _wants_ndjson():
+            report = _photo_report(images, student_roll_numbers)
+            return Response(stream_with_context(report), mimetype='application/x-ndjson')
+
+        photos = {}
+        for status, result in _encode_uploaded_photos(images, student_roll_numbers):
+            if status == 'success':
+                photos[result['roll_number']] = result['image_path']
+                results['success'].append(result)
+            else:
+                results['errors'].append(result)
         
-        # Process each file
-        for file in uploaded_files:
-            try:
-                # Get the original filename and extract roll number
-                original_filename = secure_filename(file.filename)
-                
-                # Try different methods to extract roll number:
-                # 1. Use the filename without extension as roll number
-                filename_without_ext = os.path.splitext(original_filename)[0].lower()
-                
-                # 2. Check if file matches an existing roll number
-                matching_roll = None
-                if filename_without_ext in student_roll_numbers:
-                    matching_roll = filename_without_ext
-                
-                # If no match found, skip this file
-                if not matching_roll:
-                    results['errors'].append({
-                        'filename': original_filename,
-                        'error': f'No student found with roll number matching filename: {filename_without_ext}'
-                    })
-                    continue
-                    
-                # Get the student and determine file extension
-                student = student_roll_numbers[matching_roll]
-                file_ext = os.path.splitext(original_filename)[1].lower()
-                if not file_ext:
-                    file_ext = '.jpg'  # Default to jpg if no extension
-                
-                # Create the new filename
-                new_filename = f"{matching_roll}{file_ext}"
-                file_path = os.path.join(upload_path, new_filename)
-                
-                # Save the file with compression
-                try:
-                    file.stream.seek(0)
-                    with Image.open(file.stream) as img:
-                        if img.mode in ("P", "RGBA"):
-                            img = img.convert("RGB")
-                        max_size = (800, 800)
-                        img.thumbnail(max_size, Image.LANCZOS)
-                        # Save main as WEBP
-                        new_filename = f"{matching_roll}.webp"
-                        file_path = os.path.join(upload_path, new_filename)
-                        img.save(file_path, format='WEBP', quality=80, method=6)
-                        # Generate WebP thumbnail
-                        try:
-                            thumb_dir = os.path.join(upload_path, 'thumbs')
-                            if not os.path.exists(thumb_dir):
-                                os.makedirs(thumb_dir)
-                            thumb_path = os.path.join(thumb_dir, f"{matching_roll}_thumb.webp")
-                            thumb = img.copy()
-                            thumb.thumbnail((256, 256), Image.LANCZOS)
-                            thumb.save(thumb_path, format='WEBP', quality=75, method=6)
-                        except Exception:
-                            pass
-                except Exception:
-                    file.stream.seek(0)
-                    file.save(file_path)
-                
-                # Update the student record with the image path
-                image_rel_path = f"uploads/{new_filename}"
-                
-                # Find the student in the original list and update
-                for s in students:
-                    if s.get('rollNo', '').lower() == matching_roll:
-                        s['profileImage'] = image_rel_path
-                        break
-                
-                # Add to success results
-                results['success'].append({
-                    'original_filename': original_filename,
-                    'roll_number': matching_roll,
-                    'new_filename': new_filename,
-                    'image_path': image_rel_path
-                })
-                
-            except Exception as e:
-                results['errors'].append({
-                    'filename': original_filename if 'original_filename' in locals() else 'unknown',
-                    'error': str(e)
-                })
-        
-        # Save updated student data
-        save_students(students)
+        # Save updated student data, as stored now
+        if photos:
+            _record_photos(photos)
         
         # Return results
         return jsonify({
@@ -1504,6 +1692,9 @@ def bulk_image_upload():
             'results': results
         })
         
+    except HTTPException:
+        # Oversized or malformed bodies get their own status
+        raise
     except Exception as e:
         print(f"Error in bulk_image_upload: {str(e)}")
         return jsonify({
@@ -1511,5 +1702,48 @@ def bulk_image_upload():
             'error': str(e)
         }), 500
 
+@app.route('/bulk_image_zip', methods=['POST'])
+def bulk_image_zip():
+    """Import profile photos from a ZIP archive, e.g. one per class
+
+    Entries are decompressed one at a time straight from the uploaded
+    archive (never extracted to disk) and matched to students by file name,
+    folders ignored. The response is NDJSON: one line per entry as it
+    finishes, then a summary line.
+    """
+    _check_content_length()
+    archive = request.files.get('archive')
+    if not archive or not archive.filename:
+        return jsonify({'error': 'No archive provided'}), 400
+    # The report is streamed after the view returns, when Flask has already
+    # closed the request's files, so take the archive out of the request
+    stream, archive.stream = archive.stream, BytesIO()
+    try:
+        zf = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile:
+        stream.close()
+        return jsonify({'error': 'Not a valid ZIP archive'}), 400
+
+    student_roll_numbers = {str(s.get('rollNo', '')).strip().lower() for s in load_students()}
+    max_image_bytes = app.config['MAX_IMAGE_BYTES']
+
+    def archive_images():
+        for info in zf.infolist():
+            name = os.path.basename(info.filename)
+            # Skip folders and macOS resource forks / hidden files
+            if info.is_dir() or not name or name.startswith('.') or '__MACOSX' in info.filename:
+                continue
+            if info.file_size > max_image_bytes:
+                yield name, ValueError(f'File exceeds {max_image_bytes / (1024 * 1024):.1f} MB')
+            else:
+                yield name, zf.open(info)
+
+    def close_archive():
+        zf.close()
+        stream.close()
+
+    report = _photo_report(archive_images(), student_roll_numbers, close_archive)
+    return Response(stream_with_context(report), mimetype='application/x-ndjson')
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True) 
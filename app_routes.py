@@ -1,9 +1,8 @@
-from flask import Flask, render_template, request, jsonify, flash, redirect, url_for, send_file
+from flask import Flask, render_template, request, jsonify, flash, redirect, url_for, send_file, Response
 import os
 import uuid
 from datetime import datetime
 from werkzeug.utils import secure_filename
-from PIL import Image
 from student_data import (
     get_student_by_barcode, 
     check_duplicate_student, 
@@ -18,17 +17,38 @@ from excel_handler import (
     import_students_from_excel, 
     export_students_to_excel, 
     update_students_from_excel, 
-    compare_excel_with_database
+    compare_excel_with_database,
+    iter_students_csv,
+    iter_students_ndjson
 )
+from import_jobs import submit_job, get_job
+from upload_streaming import SpooledRequest
+from image_pipeline import InvalidImage, schedule_profile_image, thumbnail_path, cache_static_images
+from thumbnails import stored_profile_image, send_variant
+from sprite_sheets import class_sprite
+from image_gc import enqueue_image_cleanup
+from photo_pack import PACK_PREFIX, packed_entry, send_packed
 from flask import current_app
 
 # Create Flask app
 app = Flask(__name__)
+app.request_class = SpooledRequest
 
 # Add secret key for flash messages
 app.secret_key = os.environ.get('SECRET_KEY', 'default_secret_key_for_development')
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 86400  # cache static files for a day
 
+# Upload limits: whole request body and in-memory part size
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 500)) * 1024 * 1024
+app.config['UPLOAD_SPOOL_MAX_MEMORY'] = 1024 * 1024
+
+# 'pack' appends new photos to a few pack files instead of one file per photo
+app.config['PHOTO_STORE'] = os.environ.get('PHOTO_STORE', 'files')
+
+# What happens to images nothing refers to any more: 'quarantine' moves them
+# to uploads/quarantine, 'delete' removes them
+app.config['IMAGE_GC_MODE'] = os.environ.get('IMAGE_GC_MODE', 'quarantine')
+
 # Configure upload folders
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 PROFILE_UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/uploads')
@@ -48,6 +68,9 @@ def _resolve_profile_image_internal(profile_image, roll_no):
     Tries the stored path first, then guesses by roll number with common extensions and cases.
     """
     try:
+        # Packed photos are looked up in the pack index, not on disk
+        if str(profile_image or '').startswith(PACK_PREFIX) and packed_entry(profile_image):
+            return profile_image
         static_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
         candidates = []
         if profile_image:
@@ -78,6 +101,17 @@ def _resolve_profile_image_thumb(profile_image, roll_no):
     """
     try:
         static_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+        stored = str(profile_image or '').replace('\\', '/')
+        # Content-addressed photos carry their own thumbnail; older per-roll
+        # thumbnails would be stale for them and for pending raw uploads
+        if stored.startswith('uploads/cas/'):
+            thumb_cas = os.path.join(static_root, thumbnail_path(stored))
+            if os.path.exists(thumb_cas):
+                return os.path.relpath(thumb_cas, static_root).replace('\\', '/')
+        if stored.startswith(PACK_PREFIX) and packed_entry(thumbnail_path(stored)):
+            return thumbnail_path(stored)
+        if stored.startswith(('uploads/cas/', 'uploads/raw/', PACK_PREFIX)):
+            return _resolve_profile_image_internal(profile_image, roll_no)
         roll_str = (str(roll_no or '').strip())
         # Prefer webp thumbnails
         thumb_webp = os.path.join(static_root, 'uploads', 'thumbs', f"{roll_str.lower()}_thumb.webp")
@@ -87,11 +121,24 @@ def _resolve_profile_image_thumb(profile_image, roll_no):
         pass
     return _resolve_profile_image_internal(profile_image, roll_no)
 
+def _class_sprite(class_name, class_students):
+    return class_sprite(class_name, class_students, _resolve_profile_image_internal)
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return jsonify({'success': False, 'error': f'Upload too large (limit {limit_mb} MB)'}), 413
+
+@app.after_request
+def add_image_cache_headers(response):
+    return cache_static_images(response, request.path)
+
 @app.context_processor
 def inject_image_resolver():
     return {
         'resolve_profile_image': _resolve_profile_image_internal,
-        'resolve_profile_image_thumb': _resolve_profile_image_thumb
+        'resolve_profile_image_thumb': _resolve_profile_image_thumb,
+        'class_sprite': _class_sprite
     }
 
 def _avatar_style(name):
@@ -148,53 +195,16 @@ def inject_avatar_style():
     }
 
 def save_profile_image(file, roll_no):
-    """Save and compress student profile image with roll number as filename."""
-    if file and allowed_file(file.filename):
-        file_ext = file.filename.rsplit('.', 1)[1].lower()
-        roll_no_lower = str(roll_no).strip().lower()
-        filename = f"{roll_no_lower}.{file_ext}"
-        file_path = os.path.join(PROFILE_UPLOAD_FOLDER, filename)
+    """Store a student profile image with roll number as filename.
 
-        # Ensure destination folder exists
-        if not os.path.exists(PROFILE_UPLOAD_FOLDER):
-            os.makedirs(PROFILE_UPLOAD_FOLDER)
-
-        # Process with Pillow: resize and compress
+    The upload is kept as-is and compressed to WebP in the background.
+    Files that are not readable images are ignored.
+    """
+    if file and allowed_file(file.filename):
         try:
-            file.stream.seek(0)
-            with Image.open(file.stream) as img:
-                # Convert mode for JPEG if needed
-                if img.mode in ("P", "RGBA"):
-                    img = img.convert("RGB")
-
-                # Resize to a reasonable max dimension to reduce bytes
-                max_size = (800, 800)
-                img.thumbnail(max_size, Image.LANCZOS)
-
-                save_kwargs = {}
-                # Save main as WEBP for smaller size
-                filename = f"{roll_no_lower}.webp"
-                file_path = os.path.join(PROFILE_UPLOAD_FOLDER, filename)
-                img.save(file_path, format='WEBP', quality=80, method=6)
-
-                # Also generate fast WebP thumbnail (256x256)
-                try:
-                    thumb_dir = os.path.join(PROFILE_UPLOAD_FOLDER, 'thumbs')
-                    if not os.path.exists(thumb_dir):
-                        os.makedirs(thumb_dir)
-                    thumb_path = os.path.join(thumb_dir, f"{roll_no_lower}_thumb.webp")
-                    thumb = img.copy()
-                    thumb.thumbnail((256, 256), Image.LANCZOS)
-                    thumb.save(thumb_path, format='WEBP', quality=75, method=6)
-                except Exception:
-                    pass
-
-        except Exception:
-            # If processing fails, fallback to saving original
-            file.stream.seek(0)
-            file.save(file_path)
-
-        return f"uploads/{filename}"
+            return schedule_profile_image(file, roll_no)
+        except InvalidImage as e:
+            print(f"Error in save_profile_image: {str(e)}")
     return None
 
 # Routes
@@ -382,13 +392,40 @@ def edit_student(student_id):
 def delete_student_route(student_id):
     """Delete a student"""
     try:
-        result = delete_student(student_id)
-        return jsonify(result), 200 if result['success'] else 404
+        student = get_student_by_barcode(student_id)
+        success, message = delete_student(student_id)
+        if success and student:
+            enqueue_image_cleanup([student], _resolve_profile_image_internal, app.config['IMAGE_GC_MODE'])
+        return jsonify({'success': success, 'message': message}), 200 if success else 404
 
     except Exception as e:
         print(f"Error in delete_student: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _run_import_job(file_path, progress):
+    return import_students_from_excel(file_path)
+
+def _run_compare_job(file_path, progress):
+    return compare_excel_with_database(file_path)
+
+def _job_accepted(job):
+    """202 response pointing the client at the job status endpoint"""
+    return jsonify({
+        'success': True,
+        'jobId': job['id'],
+        'status': job['status'],
+        'reused': job['reused'],
+        'statusUrl': url_for('job_status', job_id=job['id'])
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Progress and final report of a background Excel job"""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job), 200
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """Upload an Excel file with student data"""
@@ -403,6 +440,10 @@ def upload_file():
         # Option to import directly
         import_now = request.form.get('importNow') == 'true'
         
+        if import_now and request.form.get('async') == 'true':
+            job = submit_job('import', result['file_path'], _run_import_job, file_name=file.filename)
+            return _job_accepted(job)
+        
         if import_now:
             import_result = import_students_from_excel(result['file_path'])
             
@@ -428,19 +469,57 @@ def upload_file():
         print(f"Error in upload_file: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/static/packs/<name>', methods=['GET'])
+def packed_image(name):
+    """Serve a photo stored in the pack files (PHOTO_STORE=pack)"""
+    return send_packed(name)
+
+@app.route('/img/<roll_no>', methods=['GET'])
+def profile_image_variant(roll_no):
+    """Serve a student's photo resized to ?w=64|128|256, generated on first use"""
+    source = _resolve_profile_image_internal(stored_profile_image(roll_no), roll_no)
+    if not source:
+        return redirect(url_for('static', filename='default.jpg'))
+    try:
+        return send_variant(source, request.args.get('w', type=int))
+    except Exception as e:
+        # Photos Pillow cannot read are served as stored
+        print(f"Error in profile_image_variant: {str(e)}")
+        return redirect(url_for('static', filename=source))
+
 @app.route('/export', methods=['GET'])
 def export_students():
-    """Export all students to Excel file"""
+    """Export students as Excel (default), CSV or NDJSON.
+
+    Optional query args: class=<classSection>, columns=<comma separated fields>,
+    download=true to receive the xlsx file instead of its path.
+    """
     try:
+        export_format = request.args.get('format', 'xlsx').lower()
+        class_section = request.args.get('class') or None
+        columns = [c.strip() for c in request.args.get('columns', '').split(',') if c.strip()] or None
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        
+        # CSV and NDJSON are streamed straight from the store
+        if export_format in ('csv', 'ndjson'):
+            if export_format == 'csv':
+                body, mimetype = iter_students_csv(columns, class_section), 'text/csv'
+            else:
+                body, mimetype = iter_students_ndjson(columns, class_section), 'application/x-ndjson'
+            return Response(body, mimetype=mimetype, headers={
+                'Content-Disposition': f'attachment; filename=students_export_{timestamp}.{export_format}'
+            })
+        
         output_path = os.path.join(UPLOAD_FOLDER, f"students_export_{timestamp}.xlsx")
         
-        result = export_students_to_excel(output_path)
+        result = export_students_to_excel(output_path, columns, class_section)
         
-        if result['success']:
-            return jsonify(result), 200
-        else:
+        if not result['success']:
             return jsonify(result), 400
+        if request.args.get('download') == 'true':
+            return send_file(result['file_path'], as_attachment=True,
+                             download_name=os.path.basename(result['file_path']))
+        return jsonify(result), 200
 
     except Exception as e:
         print(f"Error in export_students: {str(e)}")
@@ -460,6 +539,12 @@ def update_from_excel():
         # Get update options
         update_option = request.form.get('updateOption', 'all')  # 'all', 'missing', 'different'
         
+        if request.form.get('async') == 'true':
+            job = submit_job('update', result['file_path'],
+                             lambda path, progress: update_students_from_excel(path, update_option),
+                             options={'updateOption': update_option}, file_name=file.filename)
+            return _job_accepted(job)
+        
         # Update from Excel
         update_result = update_students_from_excel(result['file_path'], update_option)
         
@@ -486,6 +571,10 @@ def compare_excel():
         if not result['success']:
             return jsonify(result), 400
             
+        if request.form.get('async') == 'true':
+            job = submit_job('compare', result['file_path'], _run_compare_job, file_name=file.filename)
+            return _job_accepted(job)
+            
         # Compare with database
         compare_result = compare_excel_with_database(result['file_path'])
         
@@ -521,7 +610,7 @@ def debug_profile_images():
             # Check if file exists on disk
             if info['hasProfileImage'] and info['profileImagePath']:
                 full_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', student['profileImage'])
-                info['fileExists'] = os.path.exists(full_path)
+                info['fileExists'] = os.path.exists(full_path) or packed_entry(student['profileImage']) is not None
                 info['fullPath'] = full_path
             else:
                 info['fileExists'] = False
@@ -0,0 +1,74 @@
+import os
+import time
+import argparse
+from io import BytesIO
+from image_pipeline import (
+    UPLOAD_DIR, MAIN_SIZE, MAIN_QUALITY, THUMB_SIZE, THUMB_QUALITY,
+    ENCODER_PROFILES, decode_image, resize_image, encode_webp
+)
+
+
+def is_image_file(filename: str) -> bool:
+    return filename.lower().endswith(('.jpg', '.jpeg', '.png', '.webp'))
+
+
+def encode_sample(data: bytes, profile: str) -> tuple:
+    """Run the upload pipeline on one photo in memory; returns (seconds, output bytes)"""
+    start = time.perf_counter()
+    with decode_image(BytesIO(data), MAIN_SIZE) as img:
+        resize_image(img, MAIN_SIZE, profile)
+        main = encode_webp(img, MAIN_QUALITY, profile)
+        thumb = encode_webp(resize_image(img.copy(), THUMB_SIZE, profile), THUMB_QUALITY, profile)
+    return time.perf_counter() - start, len(main) + len(thumb)
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure encode time and output size of each image encoder profile.')
+    parser.add_argument('--uploads', default=UPLOAD_DIR, help='Directory with sample photos')
+    parser.add_argument('--limit', type=int, default=50, help='Number of sample photos to use')
+    parser.add_argument('--profile', action='append', choices=sorted(ENCODER_PROFILES), help='Profile to measure (repeatable, default all)')
+    args = parser.parse_args()
+
+    samples = []
+    for fname in sorted(os.listdir(args.uploads)):
+        path = os.path.join(args.uploads, fname)
+        if os.path.isfile(path) and is_image_file(fname) and fname.lower() != 'default.jpg':
+            with open(path, 'rb') as f:
+                samples.append(f.read())
+        if len(samples) >= args.limit:
+            break
+    if not samples:
+        print(f"No sample photos found in {args.uploads}")
+        return
+
+    source_kb = sum(len(data) for data in samples) / len(samples) / 1024
+    print(f"{len(samples)} sample photos, {source_kb:.1f} KB average")
+    print(f"{'profile':<12} {'mean ms':>8} {'p95 ms':>8} {'budget':>11} {'mean KB':>8}")
+
+    for profile in args.profile or list(ENCODER_PROFILES):
+        times = []
+        sizes = []
+        for data in samples:
+            try:
+                seconds, size = encode_sample(data, profile)
+            except Exception as e:
+                print(f"[ERROR] Failed encode with {profile}: {e}")
+                continue
+            times.append(seconds * 1000)
+            sizes.append(size)
+        if not times:
+            continue
+
+        budget = ENCODER_PROFILES[profile]['budget_ms']
+        p95 = percentile(times, 0.95)
+        status = 'ok' if p95 <= budget else 'OVER'
+        print(f"{profile:<12} {sum(times) / len(times):>8.1f} {p95:>8.1f} {budget:>6} {status:<4} {sum(sizes) / len(sizes) / 1024:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+import argparse
+import pandas as pd
+
+# Fields normalized by the cleaning stage
+PHONE_FIELDS = ['studentContact', 'parentNo']
+NUMBER_FIELDS = {
+    'pucTotalMarks': 0,
+    'pucObtainedMarks': 0,
+    'income': 0,
+    'pucPercentage': 2
+}
+DATE_FIELDS = ['dob']
+
+# Identifiers pandas reads as floats when their column has blanks
+ID_FIELDS = ['rollNo', 'regNo', 'aadharNo', 'abcId', 'pucRollNo', 'pucYear']
+
+# Dates are stored the way students type them at login
+DATE_FORMAT = '%d-%m-%Y'
+DATE_INPUT_FORMATS = ['%d-%m-%Y', '%d/%m/%Y', '%d.%m.%Y', '%Y-%m-%d', '%Y-%m-%d %H:%M:%S']
+
+# Excel stores dates as days since this origin
+EXCEL_EPOCH = '1899-12-30'
+
+# A single Indian mobile number, optionally with +91/91/0 prefix
+PHONE_PATTERN = r'^(?:\+?91|0)?([6-9]\d{9})$'
+
+
+def clean_phones(col):
+    """Reduce single phone numbers to 10 digits.
+
+    Values such as "9876543210 (W)" or two numbers separated by "/" are
+    annotations people rely on, so they are only stripped of a float .0.
+    """
+    col = col.str.strip().str.replace(r'\.0$', '', regex=True)
+    digits = col.str.replace(r'[\s\-()]', '', regex=True).str.extract(PHONE_PATTERN, expand=False)
+    return digits.fillna(col).where(col.notna())
+
+
+def clean_numbers(col, decimals=0):
+    """Canonical numeric strings: "600.0" -> "600", "69.8333" -> "69.83".
+
+    Non-numeric values are left as they are.
+    """
+    numbers = pd.to_numeric(col, errors='coerce')
+    if decimals:
+        numbers = numbers.round(decimals)
+    text = numbers.astype(str).str.replace(r'\.0$', '', regex=True)
+    return col.where(numbers.isna(), text)
+
+
+def clean_dates(col):
+    """Canonical DD-MM-YYYY dates from typed dates, timestamps or Excel serials"""
+    col = col.str.strip()
+    parsed = pd.Series(pd.NaT, index=col.index, dtype='datetime64[ns]')
+    for fmt in DATE_INPUT_FORMATS:
+        parsed = parsed.fillna(pd.to_datetime(col, format=fmt, errors='coerce'))
+
+    serial = col.str.fullmatch(r'\d{5}(\.0)?').fillna(False).astype(bool)
+    if serial.any():
+        days = pd.to_numeric(col[serial], errors='coerce')
+        parsed[serial] = pd.to_datetime(days, unit='D', origin=EXCEL_EPOCH)
+
+    return col.where(parsed.isna(), parsed.dt.strftime(DATE_FORMAT))
+
+
+def clean_ids(col):
+    """Drop the float .0 of integral values: "123456789012.0" -> "123456789012"."""
+    return col.str.replace(r'^(-?\d+)\.0$', r'\1', regex=True)
+
+
+def clean_student_frame(frame):
+    """Normalize phones, numeric fields and dates of a student frame.
+
+    Expects store field names and string cells (NaN where empty), as
+    produced by excel_import.normalize_student_frame. Every other column,
+    ID_FIELDS included, only loses the float .0 of integral values, so IDs
+    read back the way they were typed whichever import read the sheet.
+    """
+    frame = frame.copy()
+    cleaned = set(PHONE_FIELDS) | set(NUMBER_FIELDS) | set(DATE_FIELDS)
+    for field in frame.columns:
+        if field not in cleaned:
+            frame[field] = clean_ids(frame[field])
+    for field in PHONE_FIELDS:
+        if field in frame.columns:
+            frame[field] = clean_phones(frame[field])
+    for field, decimals in NUMBER_FIELDS.items():
+        if field in frame.columns:
+            frame[field] = clean_numbers(frame[field], decimals)
+    for field in DATE_FIELDS:
+        if field in frame.columns:
+            frame[field] = clean_dates(frame[field])
+    return frame
+
+
+def clean_students(students):
+    """Clean stored student records in place.
+
+    Returns the number of changed cells per field.
+    """
+    fields = [f for f in PHONE_FIELDS + list(NUMBER_FIELDS) + DATE_FIELDS + ID_FIELDS
+              if any(f in s for s in students)]
+    if not fields:
+        return {}
+
+    frame = pd.DataFrame([{f: s.get(f) for f in fields} for s in students])
+    present = frame.notna()
+    frame = frame.astype(str).where(present)
+    cleaned = clean_student_frame(frame)
+
+    changed = present & (cleaned != frame)
+    for position, field in zip(*changed.to_numpy().nonzero()):
+        students[position][fields[field]] = cleaned.iat[position, field]
+
+    counts = changed.sum()
+    return {field: int(counts[field]) for field in fields if counts[field]}
+
+
+def main():
+    from student_data import load_students, save_students
+
+    parser = argparse.ArgumentParser(description='Normalize phone numbers, numeric fields, dates and IDs in students.json.')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would change without saving')
+    args = parser.parse_args()
+
+    students = load_students()
+    counts = clean_students(students)
+
+    for field, count in counts.items():
+        print(f"{field}: {count} values normalized")
+    if not counts:
+        print("Nothing to clean")
+    elif not args.dry_run:
+        save_students(students)
+        print(f"Saved {len(students)} students")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+from data_cleaning import clean_student_frame
+
+# Excel values that mean "no value given" when comparing a single record
+EMPTY_VALUES = ['', 'Empty']
+
+
+def display_frame(df):
+    """Cells as stripped strings, NaN where missing"""
+    present = df.notna()
+    return df.astype(str).apply(lambda col: col.str.strip()).where(present)
+
+
+def _comparison_key(col):
+    """Comparable form of a column of display strings.
+
+    Numeric cells are rounded to 6 decimals and integral values lose their
+    trailing .0, so an Excel 600 matches a stored "600.0" and float noise
+    from a spreadsheet round trip is ignored.
+    """
+    numbers = pd.to_numeric(col, errors='coerce')
+    rounded = numbers.round(6).astype(str).str.replace(r'\.0$', '', regex=True)
+    return col.where(numbers.isna(), rounded)
+
+
+def _keyed(df):
+    """Display frame indexed by rollNo, dropping rows without one"""
+    frame = display_frame(df)
+    frame = frame[frame['rollNo'].notna()]
+    return frame.drop_duplicates('rollNo', keep='last').set_index('rollNo')
+
+
+def _changed_cells(excel, store):
+    """Cell-level differences between two frames sharing the same index.
+
+    Only fields present on both sides are compared, and only where both
+    cells have a value. Both sides go through the import's cleaning stage
+    first, so a value that would be stored unchanged (a dob typed as
+    2007-03-17 against a stored 17-03-2007) is not reported.
+    """
+    fields = [c for c in excel.columns if c in store.columns]
+    if not fields or excel.empty:
+        return []
+
+    a = excel[fields]
+    b = store.loc[excel.index, fields]
+    different = (clean_student_frame(a).apply(_comparison_key) !=
+                 clean_student_frame(b).apply(_comparison_key))
+    changed = (a.notna() & b.notna() & different).to_numpy()
+
+    rows, cols = np.nonzero(changed)
+    a_values = a.to_numpy()
+    b_values = b.to_numpy()
+    return [
+        {
+            'rollNo': excel.index[r],
+            'field': fields[c],
+            'db_value': b_values[r, c],
+            'excel_value': a_values[r, c]
+        }
+        for r, c in zip(rows, cols)
+    ]
+
+
+def diff_students(excel_df, students):
+    """Compare an Excel frame with the student store keyed on rollNo.
+
+    Returns roll numbers missing on either side and the list of changed
+    cells for students present in both.
+    """
+    if 'rollNo' not in excel_df.columns:
+        raise ValueError('Excel data has no rollNo column')
+
+    excel = _keyed(excel_df)
+    store = _keyed(pd.DataFrame(students) if students else pd.DataFrame(columns=['rollNo']))
+
+    in_store = excel.index.isin(store.index)
+    in_excel = store.index.isin(excel.index)
+
+    return {
+        'missing_in_db': excel.index[~in_store].tolist(),
+        'missing_in_excel': store.index[~in_excel].tolist(),
+        'different_values': _changed_cells(excel[in_store], store)
+    }
+
+
+def diff_student_record(excel_record, student):
+    """Changed fields between one Excel record and one stored student.
+
+    Excel fields that are empty or not on the student are ignored.
+    """
+    record = {k: v for k, v in excel_record.items()
+              if k in student and str(v).strip() not in EMPTY_VALUES}
+    record['rollNo'] = student.get('rollNo')
+
+    excel = _keyed(pd.DataFrame([record]))
+    store = _keyed(pd.DataFrame([student]))
+    return _changed_cells(excel, store)
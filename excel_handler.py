@@ -1,14 +1,27 @@
-import pandas as pd
 import os
+import io
+import csv
 import json
+from openpyxl import Workbook
 from werkzeug.utils import secure_filename
 from datetime import datetime
-from student_data import db, add_student, update_student
+from student_data import load_students, iter_students, bulk_upsert_students
+from excel_import import COLUMN_MAPPING
+from excel_diff import diff_students, display_frame
+from upload_cache import read_excel_cached
+from data_cleaning import clean_student_frame
+
+# Column order of the export: every field the import maps, then bookkeeping
+# fields. Any other stored field (barcode, mailId, ...) follows these.
+EXPORT_COLUMNS = list(dict.fromkeys(COLUMN_MAPPING.values())) + [
+    'collegeName', 'abcIdCollected', 'profileImage', 'createdAt', 'updatedAt'
+]
 
 def validate_excel_file(file_path):
     """Validate an Excel file"""
     try:
-        df = pd.read_excel(file_path)
+        # Preview, validate, compare and import all share one parse per file content
+        df = read_excel_cached(file_path)
         
         # Check required columns
         required_columns = ['rollNo', 'classSection']
@@ -96,96 +109,71 @@ def process_uploaded_file(file, upload_folder):
             'message': f'Error processing file: {str(e)}'
         }
 
+def _frame_records(df):
+    """Rows as (row number, dict of strings) with empty cells dropped.
+
+    Cells go through the same cleaning stage as the sheet import, so IDs
+    and phone numbers read back the way they were typed.
+    """
+    text = clean_student_frame(display_frame(df))
+    return [
+        (index + 2, {k: v for k, v in values.items() if isinstance(v, str)})
+        for index, values in zip(text.index, text.to_dict('records'))
+    ]
+
 def import_students_from_excel(file_path):
-    """Import students from Excel file to Firestore"""
+    """Import new students from an Excel file with a single store write"""
     validation = validate_excel_file(file_path)
     if not validation['valid']:
         return validation
         
-    df = validation['data']
+    rows = _frame_records(validation['data'])
     
-    # Initialize counters for reports
-    total_rows = len(df)
-    success_count = 0
-    skip_count = 0
-    error_count = 0
-    errors = []
-    skipped = []
+    # Existing students are skipped, new ones inserted
+    result = bulk_upsert_students([record for _, record in rows], mode='missing')
     
-    # Process each row
-    for index, row in df.iterrows():
-        try:
-            row_dict = row.dropna().to_dict()
-            
-            # Convert numeric columns to string to prevent scientific notation issues
-            for key in row_dict:
-                if isinstance(row_dict[key], (int, float)):
-                    row_dict[key] = str(int(row_dict[key]) if row_dict[key] == int(row_dict[key]) else row_dict[key])
-            
-            # Skip rows without roll number
-            if 'rollNo' not in row_dict or not row_dict['rollNo']:
-                skip_reason = f"Row {index+2}: Missing roll number"
-                skipped.append(skip_reason)
-                skip_count += 1
-                continue
-                
-            # Check if student already exists
-            roll_no = row_dict['rollNo']
-            doc_ref = db.collection('students').document(roll_no)
-            doc = doc_ref.get()
-            
-            if doc.exists:
-                skip_reason = f"Row {index+2}: Student with roll number {roll_no} already exists"
-                skipped.append(skip_reason)
-                skip_count += 1
-                continue
-                
-            # Add timestamp
-            row_dict['createdAt'] = datetime.now().isoformat()
-            
-            # Create new student document
-            doc_ref.set(row_dict)
-            success_count += 1
-            
-        except Exception as e:
-            error_msg = f"Row {index+2}: {str(e)}"
-            errors.append(error_msg)
-            error_count += 1
+    skipped = [f"Row {rows[i][0]}: {message}" for i, message in result['skipped']]
+    errors = [f"Row {rows[i][0]}: {message}" for i, message in result['errors']]
+    success_count = result['inserted']
     
     return {
         'success': True,
-        'message': f"Import completed: {success_count} added, {skip_count} skipped, {error_count} errors",
+        'message': f"Import completed: {success_count} added, {len(skipped)} skipped, {len(errors)} errors",
         'details': {
-            'total': total_rows,
+            'total': len(rows),
             'success': success_count,
-            'skipped': skip_count,
-            'error': error_count,
+            'skipped': len(skipped),
+            'error': len(errors),
             'skipped_details': skipped,
             'error_details': errors
         }
     }
 
-def export_students_to_excel(output_path=None):
-    """Export all students from Firestore to Excel file"""
+def _stored_columns(class_section=None):
+    """Every key stored on the exported students, in EXPORT_COLUMNS order first"""
+    seen = {}
+    for student in iter_students(class_section):
+        for key in student:
+            seen.setdefault(key, None)
+    return [c for c in EXPORT_COLUMNS if c in seen] + [k for k in seen if k not in EXPORT_COLUMNS]
+
+def _export_columns(columns=None, class_section=None):
+    """Columns to export: the requested subset, or every stored field"""
+    return list(columns) if columns else _stored_columns(class_section)
+
+def _export_rows(columns, class_section=None):
+    """Yield one list of cell values per student, straight from the store"""
+    for student in iter_students(class_section):
+        yield [student.get(column, '') for column in columns]
+
+def export_students_to_excel(output_path=None, columns=None, class_section=None):
+    """Export students to an Excel file without building a DataFrame.
+
+    Uses openpyxl write-only mode, so rows go from the store to disk one at
+    a time. columns and class_section narrow the export.
+    """
     try:
-        # Get all students
-        students_ref = db.collection('students')
-        students = students_ref.stream()
-        
-        students_list = []
-        for doc in students:
-            student_data = doc.to_dict()
-            student_data['id'] = doc.id
-            students_list.append(student_data)
-            
-        if not students_list:
-            return {
-                'success': False,
-                'message': 'No students found to export'
-            }
-            
-        # Convert to DataFrame
-        df = pd.DataFrame(students_list)
+        columns = _export_columns(columns, class_section)
         
         # Generate output filename if not provided
         if not output_path:
@@ -195,13 +183,28 @@ def export_students_to_excel(output_path=None):
         # Ensure directory exists
         os.makedirs(os.path.dirname(os.path.abspath(output_path)) if os.path.dirname(output_path) else '.', exist_ok=True)
         
-        # Write to Excel
-        df.to_excel(output_path, index=False)
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('Students')
+        ws.append(columns)
+        
+        count = 0
+        for row in _export_rows(columns, class_section):
+            ws.append(row)
+            count += 1
+            
+        if count == 0:
+            return {
+                'success': False,
+                'message': 'No students found to export'
+            }
+            
+        wb.save(output_path)
         
         return {
             'success': True,
-            'message': f'Successfully exported {len(students_list)} students to {output_path}',
-            'file_path': output_path
+            'message': f'Successfully exported {count} students to {output_path}',
+            'file_path': output_path,
+            'count': count
         }
         
     except Exception as e:
@@ -210,78 +213,52 @@ def export_students_to_excel(output_path=None):
             'message': f'Error exporting students: {str(e)}'
         }
 
+def iter_students_csv(columns=None, class_section=None, chunk_rows=500):
+    """Yield the student export as CSV text, a few hundred rows per chunk"""
+    columns = _export_columns(columns, class_section)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    
+    for count, row in enumerate(_export_rows(columns, class_section), 1):
+        writer.writerow(row)
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            
+    yield buffer.getvalue()
+
+def iter_students_ndjson(columns=None, class_section=None):
+    """Yield the student export as newline-delimited JSON, one student per line"""
+    columns = _export_columns(columns, class_section)
+    for row in _export_rows(columns, class_section):
+        yield json.dumps(dict(zip(columns, row))) + '\n'
+
 def update_students_from_excel(file_path, update_option='all'):
-    """Update student data from Excel file"""
+    """Update student data from Excel file with a single store write"""
     validation = validate_excel_file(file_path)
     if not validation['valid']:
         return validation
         
-    df = validation['data']
-    
-    # Get current students
-    students_ref = db.collection('students')
-    students = students_ref.stream()
-    db_students = {}
-    
-    for doc in students:
-        student_data = doc.to_dict()
-        student_data['id'] = doc.id
-        db_students[student_data['rollNo']] = student_data
+    rows = _frame_records(validation['data'])
     
-    # Process updates
-    updated_count = 0
-    added_count = 0
-    skipped_count = 0
-    errors = []
+    # update_option is 'all', 'missing' or 'different'
+    result = bulk_upsert_students([record for _, record in rows], mode=update_option)
     
-    for index, row in df.iterrows():
-        try:
-            row_dict = row.dropna().to_dict()
-            
-            # Convert numeric values to proper format
-            for key in row_dict:
-                if isinstance(row_dict[key], (int, float)):
-                    row_dict[key] = str(int(row_dict[key]) if row_dict[key] == int(row_dict[key]) else row_dict[key])
-            
-            if 'rollNo' not in row_dict or not row_dict['rollNo']:
-                skipped_count += 1
-                continue
-                
-            roll_no = row_dict['rollNo']
-            
-            if roll_no in db_students:
-                # Update existing student
-                if update_option in ['all', 'different']:
-                    update_result = update_student(roll_no, row_dict)
-                    if update_result.get('success'):
-                        updated_count += 1
-                    else:
-                        errors.append(f"Row {index+2}: {update_result.get('message')}")
-                        skipped_count += 1
-                else:
-                    skipped_count += 1
-            else:
-                # Add new student
-                if update_option in ['all', 'missing']:
-                    add_result = add_student(row_dict)
-                    if add_result.get('success'):
-                        added_count += 1
-                    else:
-                        errors.append(f"Row {index+2}: {add_result.get('error')}")
-                        skipped_count += 1
-                else:
-                    skipped_count += 1
-                    
-        except Exception as e:
-            errors.append(f"Row {index+2}: {str(e)}")
-            skipped_count += 1
+    errors = [f"Row {rows[i][0]}: {message}" for i, message in result['errors']]
+    updated_count = result['updated']
+    added_count = result['inserted']
+    unchanged_count = result['unchanged']
+    skipped_count = len(result['skipped']) + len(result['errors'])
             
     return {
         'success': True,
-        'message': f"Update completed: {updated_count} updated, {added_count} added, {skipped_count} skipped",
+        'message': f"Update completed: {updated_count} updated, {added_count} added, {unchanged_count} unchanged, {skipped_count} skipped",
         'details': {
             'updated': updated_count,
             'added': added_count,
+            'unchanged': unchanged_count,
             'skipped': skipped_count,
             'errors': errors
         }
@@ -295,63 +272,10 @@ def compare_excel_with_database(file_path):
         
     df = validation['data']
     
-    # Get students from database
-    students_ref = db.collection('students')
-    db_students = {}
-    
-    for doc in students_ref.stream():
-        student_data = doc.to_dict()
-        student_data['id'] = doc.id
-        db_students[student_data['rollNo']] = student_data
-    
-    # Compare data
-    missing_in_db = []
-    missing_in_excel = []
-    different_values = []
-    
-    # Check Excel against DB
-    for index, row in df.iterrows():
-        try:
-            if 'rollNo' not in row or pd.isna(row['rollNo']):
-                continue
-                
-            roll_no = str(int(row['rollNo']) if pd.notna(row['rollNo']) and row['rollNo'] == int(row['rollNo']) else row['rollNo'])
-            
-            if roll_no not in db_students:
-                missing_in_db.append(roll_no)
-            else:
-                # Compare values
-                for column in df.columns:
-                    if column in db_students[roll_no] and pd.notna(row[column]):
-                        excel_val = str(int(row[column]) if pd.notna(row[column]) and row[column] == int(row[column]) else row[column])
-                        db_val = str(db_students[roll_no][column])
-                        
-                        if excel_val != db_val:
-                            different_values.append({
-                                'rollNo': roll_no,
-                                'field': column,
-                                'db_value': db_val,
-                                'excel_value': excel_val
-                            })
-        except Exception as e:
-            print(f"Error comparing row {index+2}: {str(e)}")
-    
-    # Check DB against Excel
-    excel_roll_nos = []
-    for _, row in df.iterrows():
-        if 'rollNo' in row and pd.notna(row['rollNo']):
-            roll_no = str(int(row['rollNo']) if pd.notna(row['rollNo']) and row['rollNo'] == int(row['rollNo']) else row['rollNo'])
-            excel_roll_nos.append(roll_no)
-    
-    for roll_no in db_students:
-        if roll_no not in excel_roll_nos:
-            missing_in_excel.append(roll_no)
+    # Align the sheet and the store on rollNo and diff them column-wise
+    comparison = diff_students(df, load_students())
                 
     return {
         'success': True,
-        'comparison': {
-            'missing_in_db': missing_in_db,
-            'missing_in_excel': missing_in_excel,
-            'different_values': different_values
-        }
-    } 
\ No newline at end of file
+        'comparison': comparison
+    }
\ No newline at end of file
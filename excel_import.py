@@ -0,0 +1,333 @@
+import os
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import load_workbook
+from student_data import load_students, save_students, store_lock, apply_student_upserts, bulk_upsert_students
+from upload_cache import read_excel_cached
+from data_cleaning import clean_student_frame
+
+# Column mapping for Excel to database fields
+COLUMN_MAPPING = {
+    # Basic Info
+    'Roll No': 'rollNo',
+    'Reg No': 'regNo',
+    'Section': 'classSection',
+    'Student Name': 'studentName',
+    'Father Name': 'fatherName',
+    'Gender': 'gender',
+    'DOB': 'dob',
+
+    # Contact Info
+    'Email': 'email',
+    'Address': 'address',
+    'Student Contact': 'studentContact',
+    'Parent No': 'parentNo',
+
+    # Personal Info
+    'Aadhar No': 'aadharNo',
+    'Blood Group': 'bloodGroup',
+    'State': 'state',
+    'District': 'district',
+    'Religion': 'religion',
+    'Category': 'category',
+    'Caste': 'caste',
+    'Income': 'income',
+    'Category Applied': 'categoryApplied',
+
+    # PUC Details
+    'PUC/Equivalent Roll No': 'pucRollNo',
+    'PUC/Equivalent Year of Completion': 'pucYear',
+    'PUC/Equivalent Institute Name': 'pucInstitute',
+    'PUC/Equivalent Total Marks': 'pucTotalMarks',
+    'PUC/Equivalent Obtained Marks': 'pucObtainedMarks',
+    'PUC/Equivalent Percentage/CGPA': 'pucPercentage',
+
+    # Program Details
+    'Program Name': 'programName',
+    'Discipline 1': 'discipline1',
+    'Language2': 'lang2',
+
+    # ABC ID Details
+    'ABC ID': 'abcId'
+}
+
+# Cell values that are treated as empty
+NULL_SENTINELS = ['NA', 'N/A', 'NULL', 'NONE', '', '-', 'EMPTY']
+
+# Default values for fields missing from a row
+STUDENT_DEFAULTS = {
+    'classSection': 'N/A',
+    'collegeName': 'N/A',
+    'programName': 'N/A',
+    'discipline1': 'N/A',
+    'lang2': 'N/A',
+    'studentContact': 'N/A',
+    'email': 'N/A',
+    'pucRollNo': 'N/A',
+    'pucYear': 'N/A',
+    'pucInstitute': 'N/A',
+    'pucTotalMarks': '0',
+    'pucObtainedMarks': '0',
+    'pucPercentage': '0',
+    'abcId': 'N/A',
+    'abcIdCollected': 'No'
+}
+
+# Columns read as text so phone numbers keep their digits
+TEXT_COLUMNS = {'Student Contact': str, 'Parent No': str}
+
+
+def read_student_sheet(filepath):
+    """Read the first sheet of a student workbook, parsing each content once"""
+    return read_excel_cached(filepath, dtype=TEXT_COLUMNS)
+
+
+def iter_student_batches(filepath, batch_size=500):
+    """Yield the first sheet as DataFrames of at most batch_size rows.
+
+    Uses openpyxl read-only mode so only one batch is held in memory. The
+    frame index is the 0-based data row, matching pd.read_excel.
+    """
+    wb = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        columns = [str(h).strip() if h is not None else f"Unnamed: {i}" for i, h in enumerate(header)]
+        width = len(columns)
+
+        batch = []
+        index = []
+        for row_index, row in enumerate(rows):
+            # Fully blank rows carry no data but still count towards row numbers
+            if all(v is None for v in row):
+                continue
+            row = tuple(row[:width]) + (None,) * (width - len(row))
+            batch.append(row)
+            index.append(row_index)
+            if len(batch) >= batch_size:
+                yield pd.DataFrame(batch, columns=columns, index=index)
+                batch = []
+                index = []
+
+        if batch:
+            yield pd.DataFrame(batch, columns=columns, index=index)
+    finally:
+        wb.close()
+
+
+def normalize_student_frame(df):
+    """Map Excel columns to student fields and blank out null sentinels.
+
+    Returns a frame of stripped, cleaned strings, NaN where a cell is
+    empty, keeping the original row index so errors can be reported
+    against sheet rows.
+    """
+    frame = df.rename(columns=COLUMN_MAPPING)
+    frame = frame.loc[:, ~frame.columns.duplicated(keep='last')]
+    fields = [f for f in dict.fromkeys(COLUMN_MAPPING.values()) if f in frame.columns]
+    frame = frame[fields]
+
+    present = frame.notna()
+    text = frame.astype(str).apply(lambda col: col.str.strip())
+    empty = ~present | text.apply(lambda col: col.str.upper().isin(NULL_SENTINELS))
+    text = text.mask(empty)
+
+    # Canonical phones, numbers and dates so the store never needs re-normalizing
+    return clean_student_frame(text)
+
+
+def _missing_roll(frame):
+    """Boolean mask of the rows without a roll number"""
+    if 'rollNo' in frame.columns:
+        return frame['rollNo'].isna()
+    return pd.Series(True, index=frame.index)
+
+
+def student_records(frame):
+    """Split a normalized frame into student records and missing-roll errors.
+
+    Records are (row number, record) pairs with STUDENT_DEFAULTS filled in.
+    """
+    missing = _missing_roll(frame)
+    error_messages = [f"Row {index + 2}: Missing Roll Number" for index in frame.index[missing]]
+
+    rows = frame[~missing]
+    records = [
+        (index + 2, {**STUDENT_DEFAULTS, **{k: v for k, v in values.items() if isinstance(v, str)}})
+        for index, values in zip(rows.index, rows.to_dict('records'))
+    ]
+    return records, error_messages
+
+
+def merge_student_frame(students, frame):
+    """Merge a normalized frame into the students list keyed on rollNo.
+
+    Existing students are updated, new ones are appended; the caller saves
+    the list when anything was inserted or updated. Returns the
+    inserted/updated/unchanged counts and the per-row error messages.
+    """
+    records, error_messages = student_records(frame)
+    result = apply_student_upserts(students, [record for _, record in records], mode='all')
+
+    error_messages.extend(f"Row {records[i][0]}: {message}" for i, message in result['errors'])
+    counts = {key: result[key] for key in ('inserted', 'updated', 'unchanged')}
+    return counts, error_messages
+
+
+def iter_student_sheet_import(filepath, batch_size=500):
+    """Import a workbook batch by batch, committing each changed batch.
+
+    Every batch reloads students.json under store_lock and saves only its
+    own upserts. Yields a report per row once its batch is committed: {'row', 'rollNo',
+    'status'} with status inserted, updated or unchanged, or
+    {'row', 'status': 'error', 'error'}. Ends with a summary dict holding
+    'summary': True and the totals of import_student_sheet_streaming
+    (without the error messages, which were reported per row).
+    """
+    total = 0
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    error_count = 0
+
+    for batch in iter_student_batches(filepath, batch_size):
+        frame = normalize_student_frame(batch)
+        records, _ = student_records(frame)
+        missing_rows = frame.index[_missing_roll(frame)] + 2
+        outcomes = []
+
+        # Apply the batch to the store as it is now, so edits made while the
+        # import runs are kept, and commit it before reading the next one
+        with store_lock:
+            students = load_students()
+            result = apply_student_upserts(students, [record for _, record in records], 'all', outcomes)
+            if result['inserted'] or result['updated']:
+                save_students(students)
+
+        total += len(batch)
+        for key in counts:
+            counts[key] += result[key]
+        error_count += len(missing_rows) + len(result['errors'])
+
+        for row in missing_rows:
+            yield {'row': int(row), 'status': 'error', 'error': 'Missing Roll Number'}
+        errors = dict(result['errors'])
+        for i, status in outcomes:
+            row, record = records[i]
+            if status == 'error':
+                yield {'row': row, 'rollNo': record.get('rollNo'), 'status': 'error', 'error': errors[i]}
+            else:
+                yield {'row': row, 'rollNo': record.get('rollNo'), 'status': status}
+
+    yield {
+        'summary': True,
+        'total': total,
+        'success': sum(counts.values()),
+        **counts,
+        'errors': error_count
+    }
+
+
+def import_student_sheet_streaming(filepath, batch_size=500, progress=None):
+    """Import a workbook batch by batch, committing each changed batch.
+
+    progress, if given, is called with (rows_processed, error_count) after
+    every batch.
+    """
+    rows = 0
+    error_messages = []
+
+    for report in iter_student_sheet_import(filepath, batch_size):
+        if report.get('summary'):
+            del report['summary']
+            if progress and rows % batch_size:
+                progress(rows, len(error_messages))
+            return {**report, 'error_messages': error_messages}
+
+        rows += 1
+        if report['status'] == 'error':
+            error_messages.append(f"Row {report['row']}: {report['error']}")
+        if progress and rows % batch_size == 0:
+            progress(rows, len(error_messages))
+
+
+def parse_student_sheet(filepath, sheet_name=0):
+    """Read and normalize one sheet into student records.
+
+    Runs in a worker process, so it only returns plain lists: see
+    student_records.
+    """
+    df = pd.read_excel(filepath, sheet_name=sheet_name, dtype=TEXT_COLUMNS)
+    return student_records(normalize_student_frame(df))
+
+
+_pool = None
+
+
+def _get_pool():
+    """Process pool for sheet parsing, created on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _pool
+
+
+def import_student_workbooks(sources, all_sheets=False):
+    """Import several workbooks (and optionally every sheet) in one commit.
+
+    sources is a list of (filepath, label) pairs. Sheets are parsed in
+    parallel in a process pool; the records are then merged and saved
+    once. A rollNo that appears in two sources with different data is a
+    conflict: it is reported and not imported.
+    """
+    tasks = []
+    for filepath, label in sources:
+        if all_sheets:
+            wb = load_workbook(filepath, read_only=True)
+            sheet_names = wb.sheetnames
+            wb.close()
+            tasks.extend((filepath, sheet, f"{label} [{sheet}]") for sheet in sheet_names)
+        else:
+            tasks.append((filepath, 0, label))
+
+    pool = _get_pool()
+    futures = [(pool.submit(parse_student_sheet, filepath, sheet), source) for filepath, sheet, source in tasks]
+
+    by_roll = {}
+    conflicts = {}
+    total = 0
+    error_messages = []
+
+    for future, source in futures:
+        try:
+            records, errors = future.result()
+        except Exception as e:
+            error_messages.append(f"{source}: {str(e)}")
+            continue
+
+        total += len(records) + len(errors)
+        error_messages.extend(f"{source} {message}" for message in errors)
+
+        for row_number, record in records:
+            roll_no = record['rollNo']
+            seen = by_roll.get(roll_no)
+            if seen and seen[0] != source and seen[2] != record:
+                conflicts.setdefault(roll_no, [f"{seen[0]} row {seen[1]}"]).append(f"{source} row {row_number}")
+                continue
+            by_roll[roll_no] = (source, row_number, record)
+
+    accepted = [found for roll_no, found in by_roll.items() if roll_no not in conflicts]
+    result = bulk_upsert_students([record for _, _, record in accepted], mode='all')
+    error_messages.extend(f"{accepted[i][0]} Row {accepted[i][1]}: {message}" for i, message in result['errors'])
+
+    return {
+        'sheets': len(tasks),
+        'total': total,
+        'inserted': result['inserted'],
+        'updated': result['updated'],
+        'unchanged': result['unchanged'],
+        'errors': len(error_messages),
+        'error_messages': error_messages,
+        'conflicts': [{'rollNo': roll_no, 'sources': found} for roll_no, found in conflicts.items()]
+    }
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import threading
+from io import BytesIO
+from openpyxl import Workbook
+from openpyxl.styles import PatternFill, Border, Side
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.datavalidation import DataValidation
+from excel_import import COLUMN_MAPPING, NULL_SENTINELS
+from student_data import load_students, STUDENTS_JSON
+
+# Bump whenever the template layout or styling changes
+TEMPLATE_VERSION = 2
+
+# Template headers are exactly the columns the importer understands
+TEMPLATE_HEADERS = list(COLUMN_MAPPING)
+
+# Number of data rows covered by the drop-down validations
+TEMPLATE_ROWS = 1000
+
+# Built templates are kept on disk so restarts don't rebuild them
+TEMPLATE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads', 'templates')
+
+GENDERS = ['Male', 'Female', 'Other']
+BLOOD_GROUPS = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+
+# Template column -> student field whose stored values feed its drop-down
+STORE_VOCABULARIES = {
+    'Blood Group': 'bloodGroup',
+    'Category': 'category',
+    'Program Name': 'programName'
+}
+
+# Spreadsheet apps evaluate cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+_lock = threading.Lock()
+_vocabulary_cache = {'mtime': None, 'value': None}
+_template_cache = {'etag': None, 'data': None}
+
+
+def template_vocabularies():
+    """Drop-down values per template column, derived from the current store.
+
+    Recomputed only when students.json changes. Stored values that a
+    spreadsheet would run as a formula are left out, since anyone can
+    submit a student record.
+    """
+    mtime = os.path.getmtime(STUDENTS_JSON) if os.path.exists(STUDENTS_JSON) else None
+    if _vocabulary_cache['value'] is not None and _vocabulary_cache['mtime'] == mtime:
+        return _vocabulary_cache['value']
+
+    values = {header: set() for header in STORE_VOCABULARIES}
+    for student in load_students():
+        for header, field in STORE_VOCABULARIES.items():
+            value = str(student.get(field) or '').strip()
+            if value.upper() not in NULL_SENTINELS and not value.startswith(FORMULA_PREFIXES):
+                values[header].add(value)
+
+    vocabularies = {
+        'Gender': GENDERS,
+        'Blood Group': BLOOD_GROUPS + sorted(values['Blood Group'] - set(BLOOD_GROUPS)),
+        'Category': sorted(values['Category']),
+        'Program Name': sorted(values['Program Name'])
+    }
+    _vocabulary_cache.update(mtime=mtime, value=vocabularies)
+    return vocabularies
+
+
+def build_template(vocabularies):
+    """Build the student import template and return the xlsx bytes.
+
+    Drop-down lists live on a hidden sheet so long vocabularies are not
+    limited by Excel's 255 character inline list.
+    """
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Student Data Template"
+
+    header_fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+    thin = Side(style='thin')
+    header_border = Border(left=thin, right=thin, top=thin, bottom=thin)
+
+    for col, header in enumerate(TEMPLATE_HEADERS, 1):
+        cell = ws.cell(row=1, column=col, value=header)
+        cell.fill = header_fill
+        cell.border = header_border
+    ws.freeze_panes = 'A2'
+
+    lists = wb.create_sheet('Lists')
+    lists.sheet_state = 'hidden'
+
+    for list_col, (header, values) in enumerate(vocabularies.items(), 1):
+        if not values:
+            continue
+        letter = get_column_letter(list_col)
+        lists.cell(row=1, column=list_col, value=header)
+        for row, value in enumerate(values, 2):
+            # Always plain text, never a formula
+            lists.cell(row=row, column=list_col, value=value).data_type = 's'
+
+        # Store-derived lists only suggest values; new ones may still be typed
+        strict = header in ('Gender', 'Blood Group')
+        validation = DataValidation(
+            type="list",
+            formula1=f"Lists!${letter}$2:${letter}${len(values) + 1}",
+            allow_blank=True,
+            showErrorMessage=strict
+        )
+        ws.add_data_validation(validation)
+        target = get_column_letter(TEMPLATE_HEADERS.index(header) + 1)
+        validation.add(f"{target}2:{target}{TEMPLATE_ROWS}")
+
+    excel_file = BytesIO()
+    wb.save(excel_file)
+    return excel_file.getvalue()
+
+
+def get_template():
+    """Return (xlsx bytes, etag) for the current template.
+
+    The etag covers the template version and the vocabularies, so the
+    workbook is rebuilt only when one of them changes. Built templates are
+    cached in memory and under TEMPLATE_CACHE_DIR.
+    """
+    vocabularies = template_vocabularies()
+    key = json.dumps({'version': TEMPLATE_VERSION, 'vocabularies': vocabularies}, sort_keys=True)
+    etag = hashlib.sha256(key.encode('utf-8')).hexdigest()[:20]
+
+    with _lock:
+        if _template_cache['etag'] == etag:
+            return _template_cache['data'], etag
+
+        cache_path = os.path.join(TEMPLATE_CACHE_DIR, f"student_template_{etag}.xlsx")
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                data = f.read()
+        else:
+            data = build_template(vocabularies)
+            os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{cache_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, cache_path)
+
+            # Older versions can never be served again
+            for name in os.listdir(TEMPLATE_CACHE_DIR):
+                if name.startswith('student_template_') and name != os.path.basename(cache_path):
+                    os.remove(os.path.join(TEMPLATE_CACHE_DIR, name))
+
+        _template_cache.update(etag=etag, data=data)
+        return data, etag
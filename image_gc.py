@@ -0,0 +1,242 @@
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+from student_data import load_students
+from image_pipeline import STATIC_ROOT, UPLOAD_DIR, THUMB_DIR, RAW_DIR, CAS_DIR, thumbnail_path
+from photo_pack import PACK_PREFIX, packed_entry, packed_images, open_packed, remove_images
+from sprite_sheets import class_sprite_sheets
+
+IMAGE_EXTENSIONS = ('.webp', '.jpg', '.jpeg', '.png', '.gif')
+
+# A sweep never touches files younger than this: an upload can be encoded
+# into the store shortly before its student record points at it
+GC_GRACE_SECONDS = 60 * 60
+
+# Images removed per batch; references are re-read before every batch
+GC_BATCH_SIZE = 200
+
+# Quarantined images keep their path under here, outside static/
+QUARANTINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads', 'quarantine')
+
+_lock = threading.Lock()
+_jobs = queue.Queue()
+_worker = None
+_status = {'status': 'idle', 'removed': 0, 'bytes': 0, 'skipped': 0, 'lastRun': None, 'lastError': None}
+
+
+def _area(rel):
+    """Which part of the store an image path belongs to, for reports"""
+    if rel.startswith(PACK_PREFIX):
+        return 'packs'
+    for area in ('cas', 'raw', 'thumbs'):
+        if rel.startswith(f"uploads/{area}/"):
+            return area
+    return 'legacy'
+
+
+def _in_use(student, resolve):
+    """Image paths (relative to static/) a student's photo is served from"""
+    roll = str(student.get('rollNo') or '').strip()
+    stored = str(student.get('profileImage') or '').replace('\\', '/')
+    photo = resolve(student.get('profileImage'), roll) if roll else None
+    images = {rel for rel in (stored, photo) if rel}
+    for rel in list(images):
+        if rel.startswith(('uploads/cas/', PACK_PREFIX)):
+            images.add(thumbnail_path(rel))
+        elif not rel.startswith('uploads/raw/') and roll:
+            # Per-roll photos use the per-roll thumbnail
+            images.add(f"uploads/thumbs/{roll.lower()}_thumb.webp")
+    return images
+
+
+def _owned(student, resolve):
+    """Every image path a student may have left behind, used or not"""
+    roll = str(student.get('rollNo') or '').strip()
+    images = _in_use(student, resolve)
+    if roll:
+        for ext in IMAGE_EXTENSIONS:
+            images.add(f"uploads/{roll.lower()}{ext}")
+            images.add(f"uploads/{roll.upper()}{ext}")
+        images.add(f"uploads/thumbs/{roll.lower()}_thumb.webp")
+    return images
+
+
+def referenced_images(resolve):
+    """Image paths the store still points at, sprite sheets included"""
+    students = load_students()
+    referenced = set()
+    for student in students:
+        referenced |= _in_use(student, resolve)
+    referenced |= class_sprite_sheets({s.get('classSection', 'Unassigned') for s in students})
+    return referenced
+
+
+def _stored_image(rel):
+    """(size, modification time) of a stored image, or None if it is gone"""
+    if rel.startswith(PACK_PREFIX):
+        entry = packed_entry(rel)
+        if entry is None:
+            return None
+        return entry['length'], datetime.fromisoformat(entry['time']).timestamp()
+    try:
+        stat = os.stat(os.path.join(STATIC_ROOT, rel))
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+def _stored_files():
+    """Paths relative to static/ of all image files in the upload folders"""
+    rels = []
+    if os.path.isdir(UPLOAD_DIR):
+        for entry in os.scandir(UPLOAD_DIR):
+            name = entry.name.lower()
+            if entry.is_file() and name.endswith(IMAGE_EXTENSIONS) and not name.startswith('default.'):
+                rels.append(f"uploads/{entry.name}")
+    for folder in (THUMB_DIR, RAW_DIR, CAS_DIR):
+        for root, _, names in os.walk(folder):
+            for name in names:
+                # Interrupted writes leave .tmp files behind in the store
+                if name.lower().endswith(IMAGE_EXTENSIONS + ('.tmp',)):
+                    rels.append(os.path.relpath(os.path.join(root, name), STATIC_ROOT).replace('\\', '/'))
+    return rels
+
+
+def find_orphans(resolve, grace=GC_GRACE_SECONDS):
+    """(path, size) of stored images no student or sprite sheet points at.
+
+    Packed images are included; files changed within grace seconds are not.
+    """
+    referenced = referenced_images(resolve)
+    now = time.time()
+    orphans = []
+    for rel in _stored_files() + [rel for rel, _ in packed_images()]:
+        if rel in referenced:
+            continue
+        stored = _stored_image(rel)
+        if stored and now - stored[1] >= grace:
+            orphans.append((rel, stored[0]))
+    return orphans
+
+
+def orphan_report(resolve):
+    """Orphan count and bytes, per area and in total, with the paths"""
+    orphans = find_orphans(resolve)
+    areas = {}
+    for rel, size in orphans:
+        area = areas.setdefault(_area(rel), {'count': 0, 'bytes': 0})
+        area['count'] += 1
+        area['bytes'] += size
+    return {
+        'count': len(orphans),
+        'bytes': sum(size for _, size in orphans),
+        'areas': areas,
+        'files': [rel for rel, _ in orphans]
+    }
+
+
+def _quarantine(rel):
+    target = os.path.join(QUARANTINE_DIR, datetime.now().strftime('%Y%m%d'), rel)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if rel.startswith(PACK_PREFIX):
+        with open_packed(rel) as src, open(target, 'wb') as dest:
+            shutil.copyfileobj(src, dest)
+    else:
+        shutil.move(os.path.join(STATIC_ROOT, rel), target)
+
+
+def _collect(candidates, resolve, mode, grace):
+    """Delete or quarantine the candidates that are still unreferenced.
+
+    Works through them a batch at a time and re-reads the references for
+    every batch, so a photo recorded meanwhile is kept.
+    """
+    candidates = sorted(set(candidates))
+    for start in range(0, len(candidates), GC_BATCH_SIZE):
+        referenced = referenced_images(resolve)
+        now = time.time()
+        removed, freed, skipped, packed = 0, 0, 0, []
+        for rel in candidates[start:start + GC_BATCH_SIZE]:
+            stored = _stored_image(rel)
+            if stored is None:
+                continue
+            if rel in referenced or now - stored[1] < grace:
+                skipped += 1
+                continue
+            try:
+                if mode == 'quarantine':
+                    _quarantine(rel)
+                if rel.startswith(PACK_PREFIX):
+                    # Dropped from the index together below
+                    packed.append(rel)
+                elif mode != 'quarantine':
+                    os.remove(os.path.join(STATIC_ROOT, rel))
+                removed += 1
+                freed += stored[0]
+            except OSError as e:
+                print(f"Error removing orphaned image {rel}: {str(e)}")
+        if packed:
+            remove_images(packed)
+        with _lock:
+            _status['removed'] += removed
+            _status['bytes'] += freed
+            _status['skipped'] += skipped
+
+
+def _run_jobs():
+    while True:
+        kind, payload, resolve, mode = _jobs.get()
+        with _lock:
+            _status['status'] = 'running'
+        try:
+            if kind == 'sweep':
+                _collect([rel for rel, _ in find_orphans(resolve)], resolve, mode, GC_GRACE_SECONDS)
+            else:
+                _collect(payload, resolve, mode, 0)
+        except Exception as e:
+            print(f"Error in image cleanup: {str(e)}")
+            with _lock:
+                _status['lastError'] = str(e)
+        finally:
+            with _lock:
+                _status['lastRun'] = datetime.now().isoformat()
+                if _jobs.unfinished_tasks <= 1:
+                    _status['status'] = 'idle'
+            _jobs.task_done()
+
+
+def _submit(job):
+    global _worker
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_jobs, name='image-cleanup', daemon=True)
+            _worker.start()
+    _jobs.put(job)
+
+
+def enqueue_image_cleanup(students, resolve, mode='quarantine'):
+    """Clean up the images of deleted students in the background.
+
+    Call with the student records before they are removed from the store;
+    their photos, thumbnails and leftover per-roll files are collected once
+    nothing references them any more. mode is 'delete' or 'quarantine'.
+    """
+    candidates = set()
+    for student in students:
+        candidates |= _owned(student, resolve)
+    if candidates:
+        _submit(('students', sorted(candidates), resolve, mode))
+
+
+def enqueue_orphan_sweep(resolve, mode='quarantine'):
+    """Collect every orphaned image in the background"""
+    _submit(('sweep', None, resolve, mode))
+
+
+def image_cleanup_status():
+    """Copy of the cleanup progress"""
+    with _lock:
+        return {**_status, 'queued': _jobs.qsize()}
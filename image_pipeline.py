@@ -0,0 +1,285 @@
+import hashlib
+import math
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from PIL import Image
+from flask import after_this_request, current_app
+from werkzeug.utils import secure_filename
+
+# Profile photos live under static/uploads, thumbnails under static/uploads/thumbs
+STATIC_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+UPLOAD_DIR = os.path.join(STATIC_ROOT, 'uploads')
+THUMB_DIR = os.path.join(UPLOAD_DIR, 'thumbs')
+
+# Uploads waiting for their background encode
+RAW_DIR = os.path.join(UPLOAD_DIR, 'raw')
+
+# Encoded photos are stored under the hash of their bytes and never change,
+# so they can be cached by browsers for good
+CAS_DIR = os.path.join(UPLOAD_DIR, 'cas')
+CAS_URL_PREFIX = '/static/uploads/cas/'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Only these image types go into the store, checked against their leading bytes
+CAS_EXTENSIONS = {'.webp', '.jpg', '.png'}
+
+MAIN_SIZE = (800, 800)
+MAIN_QUALITY = 80
+THUMB_SIZE = (256, 256)
+THUMB_QUALITY = 75
+
+# Encoder settings per kind of work. Interactive encodes happen while someone
+# waits on the response; batch encodes run in the background and can afford
+# the slower, denser WebP method. budget_ms is the per-photo target the
+# benchmark checks each profile against.
+ENCODER_PROFILES = {
+    'interactive': {'method': 4, 'resample': Image.BICUBIC, 'budget_ms': 150},
+    'batch': {'method': 6, 'resample': Image.LANCZOS, 'budget_ms': 1500}
+}
+
+# Photo uploads accepted, by Pillow format, and the extension they are kept under
+UPLOAD_FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+UPLOAD_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+
+_pool = None
+
+
+class InvalidImage(Exception):
+    """Raised for an upload that is not a supported, readable image"""
+
+
+def get_image_pool():
+    """Process pool for image encoding, one worker per CPU, created on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _pool
+
+
+def decode_image(source, size, cover=False):
+    """Open an image (path or file object) that will be shrunk to fit size.
+
+    The image is decoded for twice the size it ends up at: fitted inside
+    size, or with cover covering it, as for a cropped avatar. JPEGs are
+    decoded at a reduced scale (draft mode) and other formats are
+    reduce()d by an integer factor towards that box, so the final resample
+    still has detail to work with.
+    """
+    img = Image.open(source)
+    pick = max if cover else min
+    scale = pick(size[0] / img.width, size[1] / img.height)
+    box = (max(1, math.ceil(img.width * scale)) * 2, max(1, math.ceil(img.height * scale)) * 2)
+    img.draft('RGB', box)
+    if img.mode in ("P", "RGBA"):
+        img = img.convert("RGB")
+    factor = min(img.width // box[0], img.height // box[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img
+
+
+def resize_image(img, size, profile='batch'):
+    """Shrink img in place to fit size with the profile's resampling filter"""
+    img.thumbnail(size, ENCODER_PROFILES[profile]['resample'])
+    return img
+
+
+def encode_webp(img, quality, profile='batch'):
+    """WebP bytes for img with the profile's encoder method"""
+    buf = BytesIO()
+    img.save(buf, format='WEBP', quality=quality, method=ENCODER_PROFILES[profile]['method'])
+    return buf.getvalue()
+
+
+def _has_image_signature(data, ext):
+    """Whether data starts like an image of the type ext names"""
+    if ext == '.webp':
+        return data[:4] == b'RIFF' and data[8:12] == b'WEBP'
+    if ext == '.png':
+        return data[:8] == b'\x89PNG\r\n\x1a\n'
+    if ext == '.jpg':
+        return data[:3] == b'\xff\xd8\xff'
+    return False
+
+
+def store_blob(data, ext):
+    """Write bytes into the content-addressed store and return the path
+    relative to static/. Identical content is stored once.
+
+    Store files are served with a year-long immutable cache, so only WebP,
+    JPEG and PNG images are accepted; raises ValueError for anything else.
+    """
+    ext = ext.lower()
+    if ext not in CAS_EXTENSIONS:
+        raise ValueError(f"Cannot store '{ext}' files in the image store")
+    if not _has_image_signature(data, ext):
+        raise ValueError(f"Data is not a {ext} image")
+    digest = hashlib.sha256(data).hexdigest()[:20]
+    folder = os.path.join(CAS_DIR, digest[:2])
+    filename = f"{digest}{ext}"
+    path = os.path.join(folder, filename)
+    if not os.path.exists(path):
+        os.makedirs(folder, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return f"uploads/cas/{digest[:2]}/{filename}"
+
+
+def encode_profile_image(data, profile='batch'):
+    """Encode the 800px WebP photo and 256px WebP thumbnail for a student.
+
+    data is the raw uploaded file. Both images go to the content-addressed
+    store; the thumbnail sits next to the photo as <hash>_thumb.webp.
+    Raises InvalidImage if Pillow cannot decode the upload; its bytes are
+    never stored as they are. profile picks the ENCODER_PROFILES entry.
+    Safe to run in a worker process; returns the photo path relative to
+    static/.
+    """
+    try:
+        img = decode_image(BytesIO(data), MAIN_SIZE)
+        resize_image(img, MAIN_SIZE, profile)
+        img.load()
+    except Exception as e:
+        raise InvalidImage(f'Could not read image: {str(e)}')
+
+    with img:
+        photo_path = store_blob(encode_webp(img, MAIN_QUALITY, profile), '.webp')
+
+        # The thumbnail is named after the photo it was made from
+        try:
+            thumb_path = os.path.join(STATIC_ROOT, thumbnail_path(photo_path))
+            if not os.path.exists(thumb_path):
+                thumb = resize_image(img.copy(), THUMB_SIZE, profile)
+                tmp_path = f"{thumb_path}.{uuid.uuid4().hex[:8]}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(encode_webp(thumb, THUMB_QUALITY, profile))
+                os.replace(tmp_path, thumb_path)
+        except Exception:
+            pass
+        return photo_path
+
+
+def thumbnail_path(photo_path):
+    """Thumbnail path for a content-addressed photo path, both relative to static/"""
+    base = os.path.splitext(photo_path)[0]
+    return f"{base}_thumb.webp"
+
+
+def encode_raw_upload(raw_path, raw_rel):
+    """Encode a stored raw upload. Runs in a worker process.
+
+    Returns None without encoding when no student points at the upload any
+    more, e.g. because a newer photo replaced it while it waited.
+    """
+    from student_data import load_students
+
+    if not any(s.get('profileImage') == raw_rel for s in load_students()):
+        return None
+    with open(raw_path, 'rb') as f:
+        data = f.read()
+    return encode_profile_image(data)
+
+
+def _raw_upload_encoded(future, raw_rel, pack_roll=None):
+    """Swap the encoded photo into the store and drop the raw upload.
+
+    A photo that could not be encoded is removed from its student rather
+    than served as uploaded. With pack_roll the photo is moved into the
+    packs under that roll number, unless the student has a newer photo by
+    now; the pack slot is per roll, so packing a stale photo would
+    overwrite the newer one. The raw file is only deleted once no student
+    points at it.
+    """
+    from student_data import load_students, replace_profile_image, store_lock
+    from photo_pack import pack_profile_image
+
+    try:
+        photo_path = future.result()
+    except Exception as e:
+        print(f"Error encoding profile image {raw_rel}: {str(e)}")
+        photo_path = None
+
+    try:
+        with store_lock:
+            if photo_path and pack_roll and any(s.get('profileImage') == raw_rel for s in load_students()):
+                photo_path = pack_profile_image(pack_roll, photo_path)
+            replace_profile_image(raw_rel, photo_path)
+            in_use = any(s.get('profileImage') == raw_rel for s in load_students())
+    except Exception as e:
+        print(f"Error storing profile image {raw_rel}: {str(e)}")
+        return
+    raw_path = os.path.join(STATIC_ROOT, raw_rel)
+    if not in_use and os.path.exists(raw_path):
+        os.remove(raw_path)
+
+
+def validate_image_upload(file):
+    """Check an uploaded photo and return the extension to store it under.
+
+    The filename must have an image extension and the content must be a
+    JPEG, PNG, WebP or GIF that Pillow recognises; raises InvalidImage
+    otherwise. Only the image header is read.
+    """
+    ext = os.path.splitext(secure_filename(file.filename or ''))[1].lower()
+    if ext not in UPLOAD_EXTENSIONS:
+        raise InvalidImage(f"Unsupported image type '{ext or file.filename}'")
+    file.stream.seek(0)
+    try:
+        with Image.open(file.stream) as img:
+            image_format = img.format
+    except Exception:
+        raise InvalidImage('File is not a readable image')
+    finally:
+        file.stream.seek(0)
+    if image_format not in UPLOAD_FORMATS:
+        raise InvalidImage(f"Unsupported image format '{image_format}'")
+    return UPLOAD_FORMATS[image_format]
+
+
+def schedule_profile_image(file, roll_no):
+    """Store an uploaded photo as-is and encode it in the background.
+
+    Must be called while handling a request, once the student record is
+    known to be saved. Raises InvalidImage for anything but a JPEG, PNG,
+    WebP or GIF. Returns the raw upload path to record on the student; once
+    the request has finished the photo is encoded on the image pool and the
+    student is pointed at the content-addressed result, unless their photo
+    changed again meanwhile, in which case the superseded upload is skipped.
+    With PHOTO_STORE set to 'pack' the result is packed instead.
+    """
+    roll = str(roll_no).strip().lower()
+    # Named after the detected format, never the client's extension
+    ext = validate_image_upload(file)
+
+    os.makedirs(RAW_DIR, exist_ok=True)
+    raw_path = os.path.join(RAW_DIR, f"{secure_filename(roll)}_{uuid.uuid4().hex[:8]}{ext}")
+    file.save(raw_path)
+    raw_rel = os.path.relpath(raw_path, STATIC_ROOT).replace('\\', '/')
+    pack_roll = roll if current_app.config.get('PHOTO_STORE') == 'pack' else None
+
+    # Encode only after the view has saved the student record
+    @after_this_request
+    def start_encode(response):
+        future = get_image_pool().submit(encode_raw_upload, raw_path, raw_rel)
+        future.add_done_callback(lambda f: _raw_upload_encoded(f, raw_rel, pack_roll))
+        return response
+
+    return raw_rel
+
+
+def cache_static_images(response, path):
+    """Mark content-addressed image responses as cacheable forever.
+
+    Uploaded files are also sent with nosniff so browsers only ever treat
+    them as the image type their name says.
+    """
+    if path.startswith('/static/uploads/'):
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+    if (path.startswith(CAS_URL_PREFIX) and os.path.splitext(path)[1].lower() in CAS_EXTENSIONS
+            and response.status_code in (200, 304)):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
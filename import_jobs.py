@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from upload_cache import file_digest
+
+# JSON storage for the job table, kept next to students.json
+JOBS_JSON = 'import_jobs.json'
+
+# Finished jobs are forgotten after this long
+JOB_TTL_SECONDS = 24 * 60 * 60
+
+# Imports write to the same students.json; each commit reloads the store
+# under student_data.store_lock, so a couple of workers cannot clobber each
+# other or request edits
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='import-job')
+_lock = threading.Lock()
+_jobs = None
+
+# Full results of finished jobs, in memory only; the table keeps summaries
+_results = {}
+
+
+def load_jobs():
+    if os.path.exists(JOBS_JSON):
+        with open(JOBS_JSON, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_jobs(jobs):
+    with open(JOBS_JSON, 'w') as f:
+        json.dump(jobs, f, indent=4)
+
+
+def _job_table():
+    """Return the in-memory job table, loading it on first use.
+
+    Jobs that were queued or running when the process stopped can never
+    finish, so they are marked failed and may be resubmitted.
+    """
+    global _jobs
+    if _jobs is None:
+        _jobs = load_jobs()
+        for job in _jobs.values():
+            if job['status'] in ('queued', 'running'):
+                job['status'] = 'failed'
+                job['error'] = 'Interrupted by server restart'
+        _prune(_jobs)
+        save_jobs(_jobs)
+    return _jobs
+
+
+def _prune(jobs):
+    """Drop finished jobs older than JOB_TTL_SECONDS"""
+    now = datetime.now()
+    for job_id, job in list(jobs.items()):
+        age = (now - datetime.fromisoformat(job['updatedAt'])).total_seconds()
+        if job['status'] in ('done', 'failed') and age > JOB_TTL_SECONDS:
+            del jobs[job_id]
+            _results.pop(job_id, None)
+
+
+def _summary(result):
+    """The scalar fields of a result; row lists and diffs stay in memory"""
+    if not isinstance(result, dict):
+        return result
+    return {key: value for key, value in result.items() if not isinstance(value, (list, dict))}
+
+
+def _update_job(job_id, persist=True, **fields):
+    with _lock:
+        jobs = _job_table()
+        jobs[job_id].update(fields, updatedAt=datetime.now().isoformat())
+        if persist:
+            save_jobs(jobs)
+
+
+def _run_job(job_id, runner, file_path):
+    def progress(rows_processed, error_count):
+        # Progress is only kept in memory; the table is written on status changes
+        _update_job(job_id, persist=False, progress={'rows': rows_processed, 'errors': error_count})
+
+    _update_job(job_id, status='running')
+    try:
+        result = runner(file_path, progress)
+        _results[job_id] = result
+        _update_job(job_id, status='done', result=_summary(result))
+    except Exception as e:
+        print(f"Error in import job {job_id}: {str(e)}")
+        _update_job(job_id, status='failed', error=str(e))
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def submit_job(kind, file_path, runner, options=None, file_name=None):
+    """Queue runner(file_path, progress) in the background and return the job.
+
+    The job id is derived from the file contents, kind and options, so
+    submitting an identical file while its job is still queued or running
+    returns that job instead of starting a new one. Finished jobs are run
+    again on resubmission. The job takes ownership of file_path and removes
+    it when done.
+    """
+    key = json.dumps({'kind': kind, 'digest': file_digest(file_path), 'options': options or {}}, sort_keys=True)
+    job_id = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+    with _lock:
+        jobs = _job_table()
+        _prune(jobs)
+        existing = jobs.get(job_id)
+        if existing and existing['status'] in ('queued', 'running'):
+            os.remove(file_path)
+            return dict(existing, reused=True)
+
+        now = datetime.now().isoformat()
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'fileName': file_name or os.path.basename(file_path),
+            'options': options or {},
+            'status': 'queued',
+            'progress': {'rows': 0, 'errors': 0},
+            'result': None,
+            'error': None,
+            'createdAt': now,
+            'updatedAt': now
+        }
+        jobs[job_id] = job
+        _results.pop(job_id, None)
+        save_jobs(jobs)
+
+    _executor.submit(_run_job, job_id, runner, file_path)
+    return dict(job, reused=False)
+
+
+def get_job(job_id):
+    """Return a copy of a job record or None.
+
+    The full result is included while this process still has it.
+    """
+    with _lock:
+        job = _job_table().get(job_id)
+        if not job:
+            return None
+        return dict(job, result=_results.get(job_id, job['result']))
@@ -1,11 +1,22 @@
 import os
+import json
+import hashlib
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 
+# Remembers what was produced from each source so reruns skip unchanged files.
+# Kept next to students.json rather than in static/, where it would be public
+MANIFEST_NAME = '.optimize_manifest.json'
+DEFAULT_MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), MANIFEST_NAME)
+
+# Sources below this size and within max-size are left as they are
+OPTIMIZE_MIN_BYTES = 800 * 1024
+
 
 def is_image_file(filename: str) -> bool:
     name = filename.lower()
-    return name.endswith('.jpg') or name.endswith('.jpeg') or name.endswith('.png')
+    return name.endswith(('.jpg', '.jpeg', '.png', '.webp'))
 
 
 def ensure_dir(path: str) -> None:
@@ -13,6 +24,31 @@ def ensure_dir(path: str) -> None:
         os.makedirs(path)
 
 
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(path: str) -> dict:
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[WARN] Ignoring unreadable manifest {path}: {e}")
+    return {}
+
+
+def save_manifest(path: str, manifest: dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
 def optimize_image(src_path: str, dst_path: str, max_size: int, quality: int) -> bool:
     try:
         with Image.open(src_path) as img:
@@ -22,8 +58,11 @@ def optimize_image(src_path: str, dst_path: str, max_size: int, quality: int) ->
             # Resize in-place if larger than max_size
             img.thumbnail((max_size, max_size), Image.LANCZOS)
 
-            # Save as JPEG (even from PNG) to cut bytes for photos
-            img.save(dst_path, format='JPEG', quality=quality, optimize=True)
+            if dst_path.lower().endswith('.webp'):
+                img.save(dst_path, format='WEBP', quality=quality, method=6)
+            else:
+                # Save as JPEG (even from PNG) to cut bytes for photos
+                img.save(dst_path, format='JPEG', quality=quality, optimize=True)
         return True
     except Exception as e:
         print(f"[ERROR] Failed optimize {src_path}: {e}")
@@ -43,6 +82,100 @@ def generate_thumb(src_path: str, thumb_path: str, thumb_size: int, quality: int
         return False
 
 
+def needs_optimize(src_path: str, max_size: int) -> bool:
+    """True if the source is oversized in bytes or pixels"""
+    if os.path.getsize(src_path) > OPTIMIZE_MIN_BYTES:
+        return True
+    try:
+        with Image.open(src_path) as img:
+            return max(img.size) > max_size
+    except Exception:
+        return False
+
+
+def manifest_entry(path: str, outputs: list, options: str) -> dict:
+    stat = os.stat(path)
+    return {
+        'mtime': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': file_hash(path),
+        'outputs': outputs,
+        'options': options
+    }
+
+
+def process_image(task: dict) -> dict:
+    """Optimize one source and regenerate its thumbnail. Runs in a worker.
+
+    Returns counters and the manifest entries describing the result, keyed
+    by the file name of the surviving source.
+    """
+    uploads_dir = task['uploads']
+    fname = task['fname']
+    src_path = os.path.join(uploads_dir, fname)
+    name_no_ext, ext = os.path.splitext(fname)
+    result = {'fname': fname, 'optimized': 0, 'thumbed': 0, 'entries': {}}
+
+    # Optimized main target keeps webp sources as webp, everything else becomes .jpg
+    optimized_ext = '.webp' if ext.lower() == '.webp' else '.jpg'
+    optimized_path = os.path.join(uploads_dir, f"{name_no_ext.lower()}{optimized_ext}")
+    if task['force'] or needs_optimize(src_path, task['max_size']):
+        if optimize_image(src_path, optimized_path, task['max_size'], task['quality']):
+            result['optimized'] = 1
+    best_path = optimized_path if os.path.exists(optimized_path) else src_path
+
+    # The source changed (or is new), so any existing thumbnail is stale
+    thumb_path = os.path.join(task['thumbs'], f"{name_no_ext.lower()}_thumb.webp")
+    outputs = []
+    if generate_thumb(best_path, thumb_path, task['thumb_size'], task['quality']):
+        result['thumbed'] = 1
+        outputs.append(os.path.relpath(thumb_path, uploads_dir))
+    if best_path != src_path:
+        outputs.append(os.path.relpath(optimized_path, uploads_dir))
+
+    # Replace originals with WEBP if requested
+    if task['replace_webp'] and ext.lower() != '.webp':
+        webp_target = os.path.join(uploads_dir, f"{name_no_ext.lower()}.webp")
+        try:
+            with Image.open(best_path) as img:
+                if img.mode in ("P", "RGBA"):
+                    img = img.convert("RGB")
+                img.thumbnail((task['max_size'], task['max_size']), Image.LANCZOS)
+                img.save(webp_target, format='WEBP', quality=task['quality'], method=6)
+            # Delete the original non-webp file (safeguard)
+            for path in {src_path, optimized_path}:
+                if os.path.exists(path) and path.lower() != webp_target.lower():
+                    os.remove(path)
+            # The webp is the source from now on
+            result['entries'][os.path.basename(webp_target)] = manifest_entry(webp_target, outputs[:1], task['options'])
+            return result
+        except Exception as e:
+            print(f"[ERROR] Failed convert to webp {src_path}: {e}")
+
+    if os.path.exists(src_path):
+        result['entries'][fname] = manifest_entry(src_path, outputs, task['options'])
+    return result
+
+
+def is_unchanged(entry: dict, src_path: str, uploads_dir: str, options: str) -> bool:
+    """True if the manifest entry still describes src_path and its outputs exist.
+
+    The hash is only computed when the size/mtime no longer match, so a
+    touched but identical file is not reprocessed either.
+    """
+    if not entry or entry.get('options') != options:
+        return False
+    if not all(os.path.exists(os.path.join(uploads_dir, out)) for out in entry.get('outputs', [])):
+        return False
+    stat = os.stat(src_path)
+    if entry.get('mtime') == stat.st_mtime_ns and entry.get('size') == stat.st_size:
+        return True
+    if entry.get('size') == stat.st_size and entry.get('sha256') == file_hash(src_path):
+        entry['mtime'] = stat.st_mtime_ns
+        return True
+    return False
+
+
 def main():
     parser = argparse.ArgumentParser(description='Optimize existing upload images and generate fast thumbnails (WebP).')
     parser.add_argument('--uploads', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads'), help='Path to static/uploads directory')
@@ -50,18 +183,27 @@ def main():
     parser.add_argument('--quality', type=int, default=75, help='JPEG/WebP quality (1-95)')
     parser.add_argument('--thumb-size', type=int, default=256, help='Max dimension for thumbnails')
     parser.add_argument('--replace-webp', action='store_true', help='Replace original image with a WEBP of same base name and delete the original')
-    parser.add_argument('--force', action='store_true', help='Recreate outputs even if they exist')
+    parser.add_argument('--force', action='store_true', help='Recreate outputs even if the source is unchanged')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would be processed without writing anything')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST, help='Path of the manifest of processed images (keep it outside static/)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Number of worker processes')
     args = parser.parse_args()
 
     uploads_dir = args.uploads
     thumbs_dir = os.path.join(uploads_dir, 'thumbs')
-    ensure_dir(thumbs_dir)
+    manifest_path = args.manifest
+    # Older runs kept the manifest inside the uploads folder
+    old_manifest_path = os.path.join(uploads_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path) or not os.path.exists(old_manifest_path):
+        manifest = load_manifest(manifest_path)
+    else:
+        manifest = load_manifest(old_manifest_path)
+    options = json.dumps([args.max_size, args.quality, args.thumb_size, args.replace_webp])
 
     total = 0
-    optimized = 0
-    thumbed = 0
+    tasks = []
 
-    for fname in os.listdir(uploads_dir):
+    for fname in sorted(os.listdir(uploads_dir)):
         src_path = os.path.join(uploads_dir, fname)
         if not os.path.isfile(src_path):
             continue
@@ -71,49 +213,50 @@ def main():
             continue
 
         total += 1
+        if not args.force and is_unchanged(manifest.get(fname), src_path, uploads_dir, options):
+            continue
 
-        name_no_ext, ext = os.path.splitext(fname)
-        # Optimized main target (JPEG), keeping same lowercase name with .jpg extension
-        optimized_name = f"{name_no_ext.lower()}.jpg"
-        optimized_path = os.path.join(uploads_dir, optimized_name)
-
-        # Create/overwrite optimized main only if force or file is very large
-        try_optimize = args.force or (os.path.getsize(src_path) > 800 * 1024)
-        if try_optimize:
-            if args.force or not os.path.exists(optimized_path) or optimized_path == src_path:
-                if optimize_image(src_path, optimized_path, args.max_size, args.quality):
-                    optimized += 1
-
-        # Thumbnail
-        thumb_path = os.path.join(thumbs_dir, f"{name_no_ext.lower()}_thumb.webp")
-        if args.force or not os.path.exists(thumb_path):
-            if generate_thumb(optimized_path if os.path.exists(optimized_path) else src_path, thumb_path, args.thumb_size, args.quality):
-                thumbed += 1
-
-        # Replace originals with WEBP if requested
-        if args.replace_webp:
-            webp_target = os.path.join(uploads_dir, f"{name_no_ext.lower()}.webp")
-            # Only convert if missing or forced
-            if args.force or not os.path.exists(webp_target):
-                try:
-                    with Image.open(optimized_path if os.path.exists(optimized_path) else src_path) as img:
-                        if img.mode in ("P", "RGBA"):
-                            img = img.convert("RGB")
-                        img.thumbnail((args.max_size, args.max_size), Image.LANCZOS)
-                        img.save(webp_target, format='WEBP', quality=args.quality, method=6)
-                except Exception as e:
-                    print(f"[ERROR] Failed convert to webp {src_path}: {e}")
-            # Delete the original non-webp file (safeguard)
-            try:
-                if os.path.exists(src_path) and src_path.lower() != webp_target.lower() and ext.lower() != '.webp':
-                    os.remove(src_path)
-            except Exception as e:
-                print(f"[WARN] Could not delete {src_path}: {e}")
+        tasks.append({
+            'uploads': uploads_dir,
+            'thumbs': thumbs_dir,
+            'fname': fname,
+            'max_size': args.max_size,
+            'quality': args.quality,
+            'thumb_size': args.thumb_size,
+            'replace_webp': args.replace_webp,
+            'force': args.force,
+            'options': options
+        })
 
-    print(f"Processed {total} images. Optimized: {optimized}, Thumbs: {thumbed}")
+    # Forget sources that no longer exist
+    present = set(os.listdir(uploads_dir))
+    stale = [fname for fname in manifest if fname not in present]
 
+    if args.dry_run:
+        for task in tasks:
+            print(f"[DRY-RUN] Would process {task['fname']}")
+        print(f"Found {total} images. Would process: {len(tasks)}, Unchanged: {total - len(tasks)}, Stale manifest entries: {len(stale)}")
+        return
 
-if __name__ == '__main__':
-    main()
+    for fname in stale:
+        del manifest[fname]
+
+    optimized = 0
+    thumbed = 0
+    if tasks:
+        ensure_dir(thumbs_dir)
+        with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+            for result in pool.map(process_image, tasks, chunksize=8):
+                optimized += result['optimized']
+                thumbed += result['thumbed']
+                manifest.pop(result['fname'], None)
+                manifest.update(result['entries'])
+
+    save_manifest(manifest_path, manifest)
+    if os.path.exists(old_manifest_path) and os.path.abspath(old_manifest_path) != os.path.abspath(manifest_path):
+        os.remove(old_manifest_path)
+    print(f"Processed {len(tasks)} of {total} images ({total - len(tasks)} unchanged). Optimized: {optimized}, Thumbs: {thumbed}")
 
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import os
+import argparse
+from image_pipeline import STATIC_ROOT, UPLOAD_DIR, THUMB_DIR, thumbnail_path
+from photo_pack import PACK_PREFIX, put_images, packed_path, pack_stats, compact_packs
+from student_data import load_students, replace_profile_images
+
+
+def loose_photo(student):
+    """(photo, thumbnail) paths relative to static/ for a student's unpacked photo.
+
+    Either can be None. Pending raw uploads are skipped; their encode packs
+    them once the app runs with PHOTO_STORE=pack.
+    """
+    stored = str(student.get('profileImage') or '').replace('\\', '/')
+    roll = str(student.get('rollNo') or '').strip()
+    if stored.startswith((PACK_PREFIX, 'uploads/raw/')):
+        return None, None
+    if stored.startswith('uploads/cas/') and os.path.exists(os.path.join(STATIC_ROOT, stored)):
+        thumb = thumbnail_path(stored)
+        return stored, thumb if os.path.exists(os.path.join(STATIC_ROOT, thumb)) else None
+
+    candidates = [stored] if stored else []
+    for ext in ('webp', 'jpg', 'jpeg', 'png'):
+        candidates.append(f"uploads/{roll.lower()}.{ext}")
+        candidates.append(f"uploads/{roll.upper()}.{ext}")
+    photo = next((rel for rel in candidates if os.path.isfile(os.path.join(STATIC_ROOT, rel))), None)
+    thumb = os.path.join(THUMB_DIR, f"{roll.lower()}_thumb.webp")
+    if photo and os.path.exists(thumb):
+        return photo, os.path.relpath(thumb, STATIC_ROOT).replace('\\', '/')
+    return photo, None
+
+
+def migrate(batch_size, dry_run):
+    """Pack every student's current photo and point the student at it"""
+    packed = 0
+    batch = []
+    replacements = {}
+
+    def flush():
+        nonlocal packed
+        images = []
+        for roll, photo, thumb in batch:
+            with open(os.path.join(STATIC_ROOT, photo), 'rb') as f:
+                images.append((roll, 'photo', f.read(), os.path.splitext(photo)[1].lower()))
+            if thumb:
+                with open(os.path.join(STATIC_ROOT, thumb), 'rb') as f:
+                    images.append((roll, 'thumb', f.read(), '.webp'))
+        put_images(images)
+        packed += replace_profile_images(replacements)
+        batch.clear()
+        replacements.clear()
+
+    students = load_students()
+    for student in students:
+        roll = str(student.get('rollNo') or '').strip()
+        photo, thumb = loose_photo(student) if roll else (None, None)
+        if not photo:
+            continue
+        if dry_run:
+            print(f"[DRY-RUN] Would pack {photo}" + (f" and {thumb}" if thumb else ''))
+            packed += 1
+            continue
+        batch.append((roll, photo, thumb))
+        replacements[roll] = (student.get('profileImage'), packed_path(roll, 'photo', os.path.splitext(photo)[1].lower()))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return packed, len(students)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move student photos into pack files and maintain the packs.')
+    parser.add_argument('--migrate', action='store_true', help='Pack the loose photo and thumbnail of every student')
+    parser.add_argument('--compact', action='store_true', help='Rewrite the packs without replaced photos')
+    parser.add_argument('--batch-size', type=int, default=200, help='Students packed per index and store write')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would be packed without writing anything')
+    args = parser.parse_args()
+
+    if args.migrate:
+        packed, total = migrate(max(1, args.batch_size), args.dry_run)
+        action = 'Would pack' if args.dry_run else 'Packed'
+        print(f"{action} photos of {packed} of {total} students. Loose files are left in {UPLOAD_DIR} for the orphan cleanup.")
+
+    if args.compact and not args.dry_run:
+        reclaimed = compact_packs()
+        print(f"Compacted packs, reclaimed {reclaimed / (1024 * 1024):.1f} MB")
+
+    stats = pack_stats()
+    print(f"Packs: {stats['packs']}, Images: {stats['images']}, "
+          f"Size: {stats['bytes'] / (1024 * 1024):.1f} MB, Reclaimable: {stats['deadBytes'] / (1024 * 1024):.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
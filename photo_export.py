@@ -0,0 +1,68 @@
+import io
+import os
+import time
+import zipfile
+
+# Formats that are already compressed are stored, deflating them only costs CPU
+STORED_EXTENSIONS = {'.webp', '.jpg', '.jpeg', '.png', '.gif'}
+
+# Bytes copied per step, and so roughly the largest chunk held in memory
+COPY_CHUNK_SIZE = 256 * 1024
+
+
+class _ChunkWriter(io.RawIOBase):
+    """Write-only, unseekable sink that hands back what zipfile wrote"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        """Pending output as a list of zero or one chunk"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return [data] if data else []
+
+
+def _open_path(path):
+    return open(path, 'rb')
+
+
+def iter_photo_zip(entries, missing=None, opener=_open_path):
+    """Stream a ZIP archive of photos, chunk by chunk, without a temp file.
+
+    entries yields (archive name, source) and opener(source) returns a
+    binary file for it; by default sources are file paths. WebP/JPEG/PNG entries are
+    stored as-is, anything else is deflated. missing, a list of roll numbers
+    that may be filled while entries is consumed, is added as missing.txt
+    when non-empty. The archive is written with data descriptors, so no
+    seeking is needed.
+    """
+    sink = _ChunkWriter()
+    with zipfile.ZipFile(sink, mode='w') as zf:
+        for arcname, source in entries:
+            try:
+                src = opener(source)
+            except OSError as e:
+                print(f"Error adding {source} to photo export: {str(e)}")
+                continue
+            with src:
+                mtime = time.localtime(os.fstat(src.fileno()).st_mtime)
+                info = zipfile.ZipInfo(arcname, date_time=mtime[:6])
+                stored = os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS
+                info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+                with zf.open(info, mode='w') as dest:
+                    for chunk in iter(lambda: src.read(COPY_CHUNK_SIZE), b''):
+                        dest.write(chunk)
+                        yield from sink.take()
+            yield from sink.take()
+
+        if missing:
+            zf.writestr('missing.txt', '\n'.join(missing) + '\n', compress_type=zipfile.ZIP_DEFLATED)
+    yield from sink.take()
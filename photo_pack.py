@@ -0,0 +1,342 @@
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from flask import Response, abort, request
+from werkzeug.utils import secure_filename
+from werkzeug.wsgi import wrap_file
+from image_pipeline import STATIC_ROOT, thumbnail_path
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+# Optional storage mode (PHOTO_STORE=pack): photos are appended to a few large
+# pack files instead of one file per photo. Packs are kept outside static/ so
+# they are not downloadable as a whole.
+PACK_DIR = os.environ.get('PHOTO_PACK_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'photo_packs')
+PACK_INDEX = os.path.join(PACK_DIR, 'index.json')
+
+# A new pack is started once the current one would grow past this
+PACK_MAX_BYTES = 256 * 1024 * 1024
+
+# profileImage values of packed photos; served by the /static/packs/<name> route
+PACK_PREFIX = 'packs/'
+
+# Packed photos change in place when a student is re-photographed, so they
+# are revalidated with their ETag rather than cached forever
+PACK_MAX_AGE = 300
+
+_lock = threading.Lock()
+_index = {'mtime': None, 'entries': None}
+
+mimetypes.add_type('image/webp', '.webp')
+
+
+@contextmanager
+def _pack_lock():
+    """Serialize pack writers, across processes where the OS allows it"""
+    with _lock:
+        os.makedirs(PACK_DIR, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(PACK_DIR, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _load_index(force=False):
+    """(roll|variant) -> entry, re-read only when index.json changed"""
+    mtime = os.path.getmtime(PACK_INDEX) if os.path.exists(PACK_INDEX) else None
+    if force or _index['entries'] is None or _index['mtime'] != mtime:
+        entries = {}
+        if mtime is not None:
+            try:
+                with open(PACK_INDEX, 'r') as f:
+                    entries = json.load(f)
+            except Exception as e:
+                print(f"Error loading pack index: {str(e)}")
+        _index.update(mtime=mtime, entries=entries)
+    return _index['entries']
+
+
+def _save_index(entries):
+    tmp_path = f"{PACK_INDEX}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(entries, f)
+    os.replace(tmp_path, PACK_INDEX)
+    _index.update(mtime=os.path.getmtime(PACK_INDEX), entries=entries)
+
+
+def _pack_names():
+    return sorted(name for name in os.listdir(PACK_DIR) if name.startswith('pack-') and name.endswith('.dat'))
+
+
+def _writable_pack(size):
+    """Name of the pack the next size bytes should be appended to"""
+    names = _pack_names()
+    if names and os.path.getsize(os.path.join(PACK_DIR, names[-1])) + size <= PACK_MAX_BYTES:
+        return names[-1]
+    number = int(names[-1][5:-4]) + 1 if names else 1
+    return f"pack-{number:05d}.dat"
+
+
+def _append(items, entries):
+    """Append [(key, data, ext, time)] to the packs and record them in entries.
+
+    The data is synced to disk before the caller writes the index, so the
+    index never points at bytes that are not there.
+    """
+    f = None
+    try:
+        for key, data, ext, time in items:
+            if f is None or f.tell() + len(data) > PACK_MAX_BYTES:
+                if f is not None:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    f.close()
+                f = open(os.path.join(PACK_DIR, _writable_pack(len(data))), 'ab')
+                f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            f.write(data)
+            entries[key] = {
+                'pack': os.path.basename(f.name),
+                'offset': offset,
+                'length': len(data),
+                'ext': ext,
+                'etag': hashlib.sha256(data).hexdigest()[:20],
+                'time': time or datetime.now().isoformat()
+            }
+    finally:
+        if f is not None:
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+
+
+def _key(roll_no, variant):
+    return f"{secure_filename(str(roll_no).strip().lower())}|{variant}"
+
+
+def packed_path(roll_no, variant='photo', ext='.webp'):
+    """profileImage-style path (relative to static/) of a packed image"""
+    roll = secure_filename(str(roll_no).strip().lower())
+    return f"{PACK_PREFIX}{roll}_thumb{ext}" if variant == 'thumb' else f"{PACK_PREFIX}{roll}{ext}"
+
+
+def _parse(rel):
+    """Index key for a packed path, or None for any other path"""
+    rel = str(rel or '').replace('\\', '/')
+    if not rel.startswith(PACK_PREFIX):
+        return None
+    stem = os.path.splitext(rel[len(PACK_PREFIX):])[0]
+    if stem.endswith('_thumb'):
+        return _key(stem[:-len('_thumb')], 'thumb')
+    return _key(stem, 'photo')
+
+
+def put_images(images):
+    """Append [(roll, variant, data, ext)] to the packs with one index write.
+
+    An image already packed for the same roll and variant is superseded; its
+    bytes stay in the pack until compact_packs runs.
+    """
+    with _pack_lock():
+        entries = dict(_load_index(force=True))
+        _append([(_key(roll, variant), data, ext, None) for roll, variant, data, ext in images], entries)
+        _save_index(entries)
+
+
+def packed_entry(rel):
+    """Index entry for a packed path, or None when it is not packed"""
+    key = _parse(rel)
+    return _load_index().get(key) if key else None
+
+
+def packed_images():
+    """(packed path, index entry) for every image in the packs"""
+    images = []
+    for key, entry in _load_index().items():
+        roll, variant = key.split('|', 1)
+        images.append((packed_path(roll, variant, entry['ext']), entry))
+    return images
+
+
+def remove_images(rels):
+    """Drop packed images from the index with one write.
+
+    Their bytes are reclaimed by the next compact_packs. Returns the number
+    of images removed.
+    """
+    keys = {_parse(rel) for rel in rels} - {None}
+    with _pack_lock():
+        entries = dict(_load_index(force=True))
+        removed = [key for key in keys if entries.pop(key, None) is not None]
+        if removed:
+            _save_index(entries)
+        return len(removed)
+
+
+def pack_profile_image(roll_no, photo_rel):
+    """Copy an encoded photo and its thumbnail into the packs.
+
+    Returns the packed path to record as profileImage. Photos that are not
+    content-addressed WebPs are returned unchanged. The loose copies are
+    left for the orphan cleanup, since other students may share them.
+    """
+    if not str(photo_rel or '').startswith('uploads/cas/') or not photo_rel.endswith('.webp'):
+        return photo_rel
+    with open(os.path.join(STATIC_ROOT, photo_rel), 'rb') as f:
+        images = [(roll_no, 'photo', f.read(), '.webp')]
+    thumb = os.path.join(STATIC_ROOT, thumbnail_path(photo_rel))
+    if os.path.exists(thumb):
+        with open(thumb, 'rb') as f:
+            images.append((roll_no, 'thumb', f.read(), '.webp'))
+    put_images(images)
+    return packed_path(roll_no)
+
+
+class _PackSlice(io.RawIOBase):
+    """Read-only view of one image inside a pack file.
+
+    Positions are relative to the image, while fileno() and the real file
+    offset stay usable for sendfile by the WSGI server.
+    """
+
+    def __init__(self, path, offset, length):
+        self._file = open(path, 'rb', buffering=0)
+        self._start = offset
+        self._end = offset + length
+        self._file.seek(offset)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def tell(self):
+        return self._file.tell() - self._start
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: self._start, io.SEEK_CUR: self._file.tell(), io.SEEK_END: self._end}[whence]
+        return self._file.seek(min(max(base + pos, self._start), self._end)) - self._start
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._end - self._file.tell())
+        if size <= 0:
+            return 0
+        return self._file.readinto(memoryview(buffer)[:size])
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def open_packed(rel):
+    """File object for a packed image; raises FileNotFoundError if it is not packed"""
+    for force in (False, True):
+        key = _parse(rel)
+        entry = _load_index(force=force).get(key) if key else None
+        if entry is None:
+            break
+        try:
+            return _PackSlice(os.path.join(PACK_DIR, entry['pack']), entry['offset'], entry['length'])
+        except FileNotFoundError:
+            # The pack was compacted away since the index was read
+            continue
+    raise FileNotFoundError(rel)
+
+
+def open_photo(rel):
+    """Open a stored photo by its path relative to static/, packed or not"""
+    if str(rel).startswith(PACK_PREFIX):
+        return open_packed(rel)
+    return open(os.path.join(STATIC_ROOT, rel), 'rb')
+
+
+def photo_version(rel):
+    """Cache key identifying the current content of a stored photo, or None if missing"""
+    if str(rel).startswith(PACK_PREFIX):
+        entry = packed_entry(rel)
+        return f"{rel}|{entry['etag']}" if entry else None
+    try:
+        stat = os.stat(os.path.join(STATIC_ROOT, rel))
+    except OSError:
+        return None
+    return f"{rel}|{stat.st_mtime_ns}|{stat.st_size}"
+
+
+def send_packed(name):
+    """Response for /static/packs/<name>, sent from the pack file.
+
+    The body is handed to the server as a file positioned at the image, so
+    servers with wsgi.file_wrapper can sendfile it; ranges and conditional
+    requests are supported.
+    """
+    rel = f"{PACK_PREFIX}{name}"
+    entry = packed_entry(rel)
+    if entry is None:
+        abort(404)
+    try:
+        data = open_packed(rel)
+    except FileNotFoundError:
+        abort(404)
+    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    response = Response(wrap_file(request.environ, data), mimetype=mimetype, direct_passthrough=True)
+    response.content_length = entry['length']
+    response.set_etag(entry['etag'])
+    response.cache_control.public = True
+    response.cache_control.max_age = PACK_MAX_AGE
+    return response.make_conditional(request, accept_ranges=True, complete_length=entry['length'])
+
+
+def pack_stats():
+    """Pack count, sizes and the bytes held by superseded images"""
+    entries = _load_index()
+    names = _pack_names() if os.path.isdir(PACK_DIR) else []
+    total = sum(os.path.getsize(os.path.join(PACK_DIR, name)) for name in names)
+    live = sum(entry['length'] for entry in entries.values())
+    return {'packs': len(names), 'images': len(entries), 'bytes': total, 'liveBytes': live, 'deadBytes': total - live}
+
+
+def compact_packs():
+    """Rewrite the packs with only the images the index still points to.
+
+    New packs are written and indexed before the old ones are removed, so
+    readers holding the previous index keep working. Returns the bytes
+    reclaimed.
+    """
+    with _pack_lock():
+        entries = _load_index(force=True)
+        old_names = _pack_names()
+        before = sum(os.path.getsize(os.path.join(PACK_DIR, name)) for name in old_names)
+
+        # Start numbering after the current packs so nothing is overwritten
+        open(os.path.join(PACK_DIR, _writable_pack(PACK_MAX_BYTES + 1)), 'ab').close()
+        compacted = {}
+
+        def live_images():
+            for key, entry in sorted(entries.items(), key=lambda item: (item[1]['pack'], item[1]['offset'])):
+                with _PackSlice(os.path.join(PACK_DIR, entry['pack']), entry['offset'], entry['length']) as f:
+                    yield key, f.read(), entry['ext'], entry['time']
+
+        _append(live_images(), compacted)
+        _save_index(compacted)
+
+        for name in old_names:
+            os.remove(os.path.join(PACK_DIR, name))
+        after = sum(os.path.getsize(os.path.join(PACK_DIR, name)) for name in _pack_names())
+        return before - after
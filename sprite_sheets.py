@@ -0,0 +1,234 @@
+import hashlib
+import json
+import math
+import os
+import threading
+from PIL import Image, ImageOps
+from image_pipeline import STATIC_ROOT, ENCODER_PROFILES, store_blob, decode_image, encode_webp
+from photo_pack import open_photo, photo_version
+
+# Every avatar is a square cell of this many pixels in the sheet
+SPRITE_CELL = 64
+SPRITE_COLUMNS = 12
+SPRITE_QUALITY = 80
+
+# Bump whenever the cell size, layout or encoder settings change
+SPRITE_VERSION = 1
+
+# Coordinate maps, one JSON file per class; the sheets themselves live in the
+# content-addressed store so their URLs can be cached forever
+SPRITE_MAP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads', 'sprites')
+
+_lock = threading.Lock()
+_maps = {}
+
+# Sheets waiting for the builder thread: class name -> members to draw
+_pending = {}
+# Class name -> members (roll -> source key) of the sheet being built
+_building = {}
+_worker = None
+
+
+def _map_path(class_name):
+    slug = hashlib.sha256(str(class_name).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(SPRITE_MAP_DIR, f"{slug}.json")
+
+
+def _load_map(class_name):
+    path = _map_path(class_name)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                sprite = json.load(f)
+            if sprite.get('version') == SPRITE_VERSION:
+                return sprite
+        except Exception as e:
+            print(f"Error loading sprite map for {class_name}: {str(e)}")
+    return None
+
+
+def _save_map(class_name, sprite):
+    os.makedirs(SPRITE_MAP_DIR, exist_ok=True)
+    path = _map_path(class_name)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(sprite, f)
+    os.replace(tmp_path, path)
+
+
+def _cell_box(index, columns):
+    x = (index % columns) * SPRITE_CELL
+    y = (index // columns) * SPRITE_CELL
+    return (x, y, x + SPRITE_CELL, y + SPRITE_CELL)
+
+
+def _decode_avatar(photo):
+    with open_photo(photo) as source, decode_image(source, (SPRITE_CELL, SPRITE_CELL), cover=True) as img:
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        resample = ENCODER_PROFILES['interactive']['resample']
+        return ImageOps.fit(img, (SPRITE_CELL, SPRITE_CELL), resample)
+
+
+def _layout(previous, rolls):
+    """Cell index per roll. Members keep their cell; new ones fill the gaps.
+
+    A layout that has become mostly holes is packed again from scratch.
+    """
+    positions = {}
+    if previous:
+        kept = {roll: index for roll, index in previous['positions'].items() if roll in rolls}
+        if len(kept) * 2 >= max(kept.values(), default=-1) + 1:
+            positions = kept
+
+    used = set(positions.values())
+    free = (index for index in range(len(rolls) + len(used)) if index not in used)
+    for roll in rolls:
+        if roll not in positions:
+            positions[roll] = next(free)
+    return positions
+
+
+def _build_sheet(previous, members):
+    """Render the sheet for members [(roll, photo, source key)].
+
+    Cells whose source is unchanged are copied from the previous sheet, so
+    only new or changed photos are decoded.
+    """
+    positions = _layout(previous, [roll for roll, _, _ in members])
+    cell_count = max(positions.values()) + 1
+    columns = min(SPRITE_COLUMNS, cell_count)
+    rows = math.ceil(cell_count / columns)
+
+    old_sheet = None
+    if previous:
+        try:
+            old_sheet = Image.open(os.path.join(STATIC_ROOT, previous['sheet']))
+            old_sheet.load()
+        except Exception:
+            old_sheet = None
+
+    sheet = Image.new('RGB', (columns * SPRITE_CELL, rows * SPRITE_CELL), (255, 255, 255))
+    sources = {}
+    for roll, photo, key in members:
+        if old_sheet is not None and previous['sources'].get(roll) == key:
+            avatar = old_sheet.crop(_cell_box(previous['positions'][roll], previous['columns']))
+        else:
+            try:
+                avatar = _decode_avatar(photo)
+            except Exception:
+                # Not decodable; the template falls back to the single image
+                continue
+        sheet.paste(avatar, _cell_box(positions[roll], columns))
+        sources[roll] = key
+
+    # Percentages position the cell whatever size the avatar is drawn at
+    cells = {}
+    for roll in sources:
+        col, row = positions[roll] % columns, positions[roll] // columns
+        x = col * 100 / (columns - 1) if columns > 1 else 0
+        y = row * 100 / (rows - 1) if rows > 1 else 0
+        cells[roll] = f"{x:.4f}% {y:.4f}%"
+
+    return {
+        'version': SPRITE_VERSION,
+        'sheet': store_blob(encode_webp(sheet, SPRITE_QUALITY, 'interactive'), '.webp'),
+        'columns': columns,
+        'rows': rows,
+        'size': f"{columns * 100}% {rows * 100}%",
+        'positions': {roll: positions[roll] for roll in sources},
+        'sources': sources,
+        'cells': cells
+    }
+
+
+def _run_builds():
+    global _worker
+    while True:
+        with _lock:
+            if not _pending:
+                _worker = None
+                return
+            class_name = next(iter(_pending))
+            members = _pending.pop(class_name)
+            wanted = {roll: key for roll, _, key in members}
+            _building[class_name] = wanted
+            current = _maps.get(class_name) or _load_map(class_name)
+        try:
+            sprite = _build_sheet(current, members)
+            sprite['members'] = wanted
+            _save_map(class_name, sprite)
+            with _lock:
+                _maps[class_name] = sprite
+        except Exception as e:
+            print(f"Error building sprite sheet for {class_name}: {str(e)}")
+        finally:
+            with _lock:
+                _building.pop(class_name, None)
+
+
+def _schedule_build(class_name, members, wanted):
+    """Queue a sheet for the builder thread, starting it if needed"""
+    global _worker
+    with _lock:
+        if _building.get(class_name) == wanted:
+            _pending.pop(class_name, None)
+            return
+        _pending[class_name] = members
+        if _worker is None:
+            _worker = threading.Thread(target=_run_builds, name='sprite-sheets', daemon=True)
+            _worker.start()
+
+
+def class_sprite(class_name, students, resolve):
+    """Return the avatar sprite sheet for one class.
+
+    resolve(profile_image, roll_no) gives a photo path relative to static/.
+    The result has the sheet path, the CSS background-size and a CSS
+    background-position per roll number; students without a usable photo
+    are left out. Returns None when nobody in the class has a photo.
+
+    Missing or outdated sheets are built in the background, never while a
+    page renders. Until then the previous sheet is returned with only the
+    cells that still show the student's current photo, or None when there
+    is no sheet yet; the template shows single avatars for the rest.
+    """
+    members = []
+    for student in students:
+        roll = student.get('rollNo')
+        rel = resolve(student.get('profileImage'), roll) if roll else None
+        if not rel:
+            continue
+        version = photo_version(rel)
+        if version is None:
+            continue
+        members.append((roll, rel, version))
+    if not members:
+        return None
+
+    wanted = {roll: key for roll, _, key in members}
+    with _lock:
+        current = _maps.get(class_name) or _load_map(class_name)
+        if current and not os.path.exists(os.path.join(STATIC_ROOT, current['sheet'])):
+            current = None
+        if current:
+            _maps[class_name] = current
+    # Up to date while nobody joined, left or changed photo
+    if current and current['members'] == wanted:
+        return current
+
+    _schedule_build(class_name, members, wanted)
+    if not current:
+        return None
+    cells = {roll: cell for roll, cell in current['cells'].items() if current['sources'].get(roll) == wanted.get(roll)}
+    return {**current, 'cells': cells}
+
+
+def class_sprite_sheets(class_names):
+    """Sheet paths (relative to static/) currently mapped for the given classes"""
+    sheets = set()
+    for class_name in class_names:
+        sprite = _maps.get(class_name) or _load_map(class_name)
+        if sprite:
+            sheets.add(sprite['sheet'])
+    return sheets
@@ -2,7 +2,9 @@ from flask import Flask, render_template, request, jsonify, url_for, flash, redi
 import os
 from dotenv import load_dotenv
 import json
+import threading
 import pandas as pd
+from functools import wraps
 from werkzeug.utils import secure_filename
 from datetime import datetime
 
@@ -12,6 +14,11 @@ load_dotenv()
 # JSON storage file path
 STUDENTS_JSON = 'students.json'
 
+# Serializes load-modify-save cycles on students.json: hold it from the load
+# to the save so concurrent requests, imports and image workers don't
+# overwrite each other's changes
+store_lock = threading.RLock()
+
 def load_students():
     if os.path.exists(STUDENTS_JSON):
         with open(STUDENTS_JSON, 'r') as f:
@@ -19,8 +26,19 @@ def load_students():
     return []
 
 def save_students(students):
-    with open(STUDENTS_JSON, 'w') as f:
+    # Write a temp file and swap it in so readers never see a partial file
+    tmp_path = f"{STUDENTS_JSON}.tmp"
+    with open(tmp_path, 'w') as f:
         json.dump(students, f, indent=4)
+    os.replace(tmp_path, STUDENTS_JSON)
+
+def with_store_lock(f):
+    """Decorator: run a load-modify-save function while holding store_lock"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with store_lock:
+            return f(*args, **kwargs)
+    return decorated_function
 
 # Student data functions
 def get_student_by_barcode(barcode):
@@ -48,6 +66,7 @@ def check_duplicate_student(roll_no, reg_no=None):
         
     return False
 
+@with_store_lock
 def add_student(student_data):
     """Add a new student to the database"""
     try:
@@ -84,6 +103,13 @@ def get_all_students():
         print(f"Error getting all students: {str(e)}")
         return []
 
+def iter_students(class_section=None):
+    """Iterate over stored students, optionally only those in one class"""
+    for student in load_students():
+        if class_section is None or student.get('classSection') == class_section:
+            yield student
+
+@with_store_lock
 def update_student(student_id, updated_data):
     """Update an existing student's data"""
     try:
@@ -108,6 +134,133 @@ def update_student(student_id, updated_data):
         print(f"Error updating student: {str(e)}")
         return False, f'Database error: {str(e)}'
 
+def apply_student_upserts(students, records, mode='all', outcomes=None):
+    """Apply many inserts/updates to an in-memory students list.
+
+    mode matches update_option: 'all' inserts new students and updates
+    existing ones, 'missing' only inserts, 'different' only updates
+    existing ones. Existing students are only rewritten with the fields
+    that actually differ; records with no differing field are counted as
+    unchanged and leave the stored student untouched. Nothing is saved;
+    the caller persists students once, and only if inserted or updated is
+    non-zero. skipped and errors hold (record index, message) pairs.
+    If an outcomes list is given, (record index, status) is appended to it
+    for every record, status being inserted, updated, unchanged, skipped or
+    error.
+    """
+    positions = {s.get('rollNo'): i for i, s in enumerate(students)}
+    reg_nos = {s.get('regNo') for s in students if s.get('regNo')}
+    now = datetime.now().isoformat()
+    
+    inserted = 0
+    updated = 0
+    unchanged = 0
+    skipped = []
+    errors = []
+    
+    def outcome(index, status):
+        if outcomes is not None:
+            outcomes.append((index, status))
+    
+    for index, record in enumerate(records):
+        roll_no = record.get('rollNo')
+        if not roll_no:
+            errors.append((index, 'Missing roll number'))
+            outcome(index, 'error')
+            continue
+            
+        position = positions.get(roll_no)
+        if position is None:
+            if mode not in ('all', 'missing'):
+                skipped.append((index, f'Student with roll number {roll_no} not found'))
+                outcome(index, 'skipped')
+                continue
+                
+            # Same duplicate check as add_student
+            reg_no = record.get('regNo')
+            if reg_no and reg_no in reg_nos:
+                errors.append((index, f'Student with Registration Number {reg_no} already exists!'))
+                outcome(index, 'error')
+                continue
+                
+            positions[roll_no] = len(students)
+            students.append({**record, 'createdAt': now})
+            if reg_no:
+                reg_nos.add(reg_no)
+            inserted += 1
+            outcome(index, 'inserted')
+        else:
+            if mode not in ('all', 'different'):
+                skipped.append((index, f'Student with roll number {roll_no} already exists'))
+                outcome(index, 'skipped')
+                continue
+                
+            # Field-level diff so no-op rows cost nothing
+            current = students[position]
+            changes = {k: v for k, v in record.items() if current.get(k) != v}
+            if not changes:
+                unchanged += 1
+                outcome(index, 'unchanged')
+                continue
+                
+            students[position] = {**current, **changes, 'updatedAt': now}
+            updated += 1
+            outcome(index, 'updated')
+            
+    return {
+        'inserted': inserted,
+        'updated': updated,
+        'unchanged': unchanged,
+        'skipped': skipped,
+        'errors': errors
+    }
+
+@with_store_lock
+def bulk_upsert_students(records, mode='all'):
+    """Insert/update many students with a single load and a single save"""
+    students = load_students()
+    result = apply_student_upserts(students, records, mode)
+    if result['inserted'] or result['updated']:
+        save_students(students)
+    return result
+
+def replace_profile_image(old_path, new_path):
+    """Point students whose photo is old_path at new_path.
+
+    Used by background image workers; a student whose photo changed again in
+    the meantime is left alone. Returns the number of students updated.
+    """
+    with store_lock:
+        students = load_students()
+        updated = 0
+        for student in students:
+            if student.get('profileImage') == old_path:
+                student['profileImage'] = new_path
+                updated += 1
+        if updated:
+            save_students(students)
+        return updated
+
+def replace_profile_images(replacements):
+    """Bulk form of replace_profile_image for maintenance tools.
+
+    replacements maps a roll number to (expected profileImage, new path);
+    students whose photo no longer matches the expected value are skipped.
+    Returns the number of students updated.
+    """
+    with store_lock:
+        students = load_students()
+        updated = 0
+        for student in students:
+            change = replacements.get(str(student.get('rollNo', '')).strip())
+            if change and student.get('profileImage') == change[0]:
+                student['profileImage'] = change[1]
+                updated += 1
+        if updated:
+            save_students(students)
+        return updated
+
+@with_store_lock
 def delete_student(student_id):
     """Delete a student from the database"""
     try:
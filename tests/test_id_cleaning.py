@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import upload_cache  # noqa: E402
+from data_cleaning import clean_student_frame  # noqa: E402
+from excel_handler import _frame_records  # noqa: E402
+from excel_import import COLUMN_MAPPING, normalize_student_frame, read_student_sheet, student_records  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def parsed_cache(tmp_path, monkeypatch):
+    # Parsed sheets are spilled to disk; keep them out of the working tree
+    monkeypatch.setattr(upload_cache, 'CACHE_DIR', str(tmp_path / 'parsed'))
+    monkeypatch.setattr(upload_cache, '_frames', upload_cache.OrderedDict())
+
+
+def test_integral_float_ids_lose_their_point_zero():
+    frame = pd.DataFrame({
+        'rollNo': ['25001.0', '25002'],
+        'aadharNo': ['123456789012.0', None],
+        'pucPercentage': ['69.8333', '70.0']
+    })
+    cleaned = clean_student_frame(frame)
+    assert cleaned['rollNo'].tolist() == ['25001', '25002']
+    assert cleaned['aadharNo'].tolist()[0] == '123456789012'
+    assert pd.isna(cleaned['aadharNo'].tolist()[1])
+    assert cleaned['pucPercentage'].tolist() == ['69.83', '70']
+
+
+def test_both_import_paths_store_the_same_ids(tmp_path):
+    # A blank makes pandas read an ID column as floats
+    columns = {
+        'Roll No': [25001, 25002],
+        'Section': ['A', 'A'],
+        'Aadhar No': [123456789012, None],
+        'ABC ID': [None, 987654321098],
+        'PUC/Equivalent Roll No': [445566, None]
+    }
+    # /upload reads Excel headers; the compare and update pages read field names
+    headed = str(tmp_path / 'headed.xlsx')
+    fields = str(tmp_path / 'fields.xlsx')
+    pd.DataFrame(columns).to_excel(headed, index=False)
+    pd.DataFrame(columns).rename(columns=COLUMN_MAPPING).to_excel(fields, index=False)
+
+    imported, _ = student_records(normalize_student_frame(read_student_sheet(headed)))
+    updated = _frame_records(upload_cache.read_excel_cached(fields))
+
+    for (_, first), (_, second) in zip(imported, updated):
+        for field, value in second.items():
+            assert first[field] == value
+    assert imported[0][1]['aadharNo'] == '123456789012'
+    assert updated[1][1]['abcId'] == '987654321098'
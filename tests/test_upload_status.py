@@ -0,0 +1,64 @@
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Keep students.json and saved uploads out of the working tree
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 4096)
+    monkeypatch.setitem(app.config, 'WARM_THUMBNAILS_ON_START', False)
+    return app.test_client()
+
+
+def test_streamed_photo_upload_over_limit_is_413(client):
+    response = client.post(
+        '/bulk_image_upload?stream=ndjson',
+        data={'images': (io.BytesIO(b'\0' * 8192), 'r1.png')},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 413
+    assert response.is_json
+
+
+def test_streamed_photo_upload_without_multipart_is_400(client):
+    response = client.post('/bulk_image_upload?stream=ndjson', data='not a form', content_type='text/plain')
+    assert response.status_code == 400
+
+
+def test_streamed_photo_upload_without_photos_is_400(client):
+    response = client.post(
+        '/bulk_image_upload?stream=ndjson',
+        data={'other': 'value'},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 400
+
+
+def test_streamed_sheet_upload_over_limit_is_413(client):
+    response = client.post(
+        '/upload?stream=ndjson',
+        data={'file': (io.BytesIO(b'\0' * 8192), 'students.xlsx')},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 413
+
+
+def test_streamed_sheet_upload_of_invalid_workbook_is_400(client, tmp_path):
+    response = client.post(
+        '/upload?stream=ndjson',
+        data={'file': (io.BytesIO(b'not a workbook'), 'students.xlsx')},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 400
+    assert response.is_json
+    # The saved upload is removed again
+    assert not list(tmp_path.glob('*.xlsx'))
@@ -0,0 +1,236 @@
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from datetime import datetime
+from flask import send_file
+from student_data import load_students, STUDENTS_JSON
+from image_pipeline import (
+    STATIC_ROOT, THUMB_DIR, THUMB_SIZE, THUMB_QUALITY,
+    decode_image, resize_image, encode_webp, thumbnail_path
+)
+from photo_pack import PACK_PREFIX, open_photo, photo_version
+
+# Avatar widths served by /img/<roll>; other requests snap to the next size up
+VARIANT_WIDTHS = (64, 128, 256)
+VARIANT_QUALITY = 75
+
+# Bump whenever the resizing or encoder settings change
+VARIANT_VERSION = 1
+
+# Generated variants are kept here, least recently used dropped beyond the cap
+VARIANT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads', 'variants')
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+# Clients revalidate with the ETag after this many seconds
+VARIANT_MAX_AGE = 300
+
+# The warmer uses a single low-priority process so requests keep the CPU
+WARMER_WORKERS = 1
+WARMER_NICENESS = 10
+
+_lock = threading.Lock()
+_inflight = {}
+_photo_cache = {'mtime': None, 'value': None}
+_warmer = {'status': 'idle', 'total': 0, 'done': 0, 'failed': 0, 'startedAt': None, 'finishedAt': None}
+_warmer_thread = None
+
+
+def stored_profile_image(roll_no):
+    """profileImage recorded for a roll number, looked up in a cached index.
+
+    The index is rebuilt only when students.json changes, so a page full of
+    avatars doesn't parse the store once per image.
+    """
+    mtime = os.path.getmtime(STUDENTS_JSON) if os.path.exists(STUDENTS_JSON) else None
+    if _photo_cache['value'] is None or _photo_cache['mtime'] != mtime:
+        index = {str(s.get('rollNo', '')).strip().lower(): s.get('profileImage') for s in load_students()}
+        _photo_cache.update(mtime=mtime, value=index)
+    return _photo_cache['value'].get(str(roll_no).strip().lower())
+
+
+def variant_width(requested):
+    """Snap a requested width to one of VARIANT_WIDTHS"""
+    if not requested:
+        return VARIANT_WIDTHS[-1]
+    return next((w for w in VARIANT_WIDTHS if w >= requested), VARIANT_WIDTHS[-1])
+
+
+def _write_file(path, data):
+    """Write data to path atomically through a temp file of its own.
+
+    Concurrent writers of the same path each get a unique temp name, so
+    none of them can replace the file with another's partial output.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp files are private; these are served as static files
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _encode_variant(source, path, width):
+    with decode_image(source, (width, width)) as img:
+        resize_image(img, (width, width), 'interactive')
+        _write_file(path, encode_webp(img, VARIANT_QUALITY, 'interactive'))
+
+
+def _prune_cache(keep):
+    """Drop the least recently used variants beyond MAX_CACHE_BYTES, except keep"""
+    entries = []
+    for entry in os.scandir(VARIANT_CACHE_DIR):
+        if entry.name.endswith('.webp') and entry.path != keep:
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries) + os.path.getsize(keep)
+    for _, size, path in sorted(entries):
+        if total <= MAX_CACHE_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def get_variant(photo, width):
+    """Return (path, etag) of a photo resized to width, encoding on first use.
+
+    photo is relative to static/ and may be packed. Variants are keyed on
+    the photo's current content, so a replaced photo gets fresh variants.
+    Concurrent requests for the same variant wait for a single encode.
+    """
+    version = photo_version(photo)
+    if version is None:
+        raise FileNotFoundError(photo)
+    key = f"{version}|{width}|{VARIANT_VERSION}"
+    etag = hashlib.sha256(key.encode('utf-8')).hexdigest()[:20]
+    path = os.path.join(VARIANT_CACHE_DIR, f"{etag}.webp")
+
+    if os.path.exists(path):
+        # Reads count as use for the LRU
+        os.utime(path)
+        return path, etag
+
+    with _lock:
+        future = _inflight.get(etag)
+        owner = future is None
+        if owner:
+            future = Future()
+            _inflight[etag] = future
+
+    if not owner:
+        future.result()
+        return path, etag
+
+    try:
+        os.makedirs(VARIANT_CACHE_DIR, exist_ok=True)
+        with open_photo(photo) as source:
+            _encode_variant(source, path, width)
+        future.set_result(path)
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(etag, None)
+
+    _prune_cache(path)
+    return path, etag
+
+
+def send_variant(photo, width):
+    """Response with the cached variant of photo, with caching headers"""
+    path, etag = get_variant(photo, variant_width(width))
+    return send_file(path, mimetype='image/webp', etag=etag, max_age=VARIANT_MAX_AGE, conditional=True)
+
+
+def _lower_priority():
+    """Worker initializer: yield the CPU to request handling"""
+    if hasattr(os, 'nice'):
+        os.nice(WARMER_NICENESS)
+
+
+def _warm_thumbnail(source, target):
+    """Write the 256px WebP thumbnail for one photo. Runs in a worker."""
+    with decode_image(source, THUMB_SIZE) as img:
+        resize_image(img, THUMB_SIZE, 'batch')
+        data = encode_webp(img, THUMB_QUALITY, 'batch')
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    _write_file(target, data)
+
+
+def missing_thumbnails(resolve):
+    """(photo, thumbnail) absolute paths for students whose thumbnail is missing.
+
+    Content-addressed photos get <hash>_thumb.webp next to them, older
+    per-roll photos get thumbs/<roll>_thumb.webp, matching what the
+    thumbnail resolvers look for. Raw uploads are skipped, their encode
+    writes the thumbnail, and so are packed photos, which are packed
+    together with theirs.
+    """
+    missing = []
+    for student in load_students():
+        roll = str(student.get('rollNo') or '').strip()
+        photo = resolve(student.get('profileImage'), roll) if roll else None
+        if not photo or photo.startswith(('uploads/raw/', PACK_PREFIX)):
+            continue
+        if photo.startswith('uploads/cas/'):
+            target = os.path.join(STATIC_ROOT, thumbnail_path(photo))
+        else:
+            target = os.path.join(THUMB_DIR, f"{roll.lower()}_thumb.webp")
+        if not os.path.exists(target):
+            missing.append((os.path.join(STATIC_ROOT, photo), target))
+    return missing
+
+
+def _run_warmer(resolve):
+    try:
+        missing = missing_thumbnails(resolve)
+        with _lock:
+            _warmer.update(status='running', total=len(missing))
+        if missing:
+            with ProcessPoolExecutor(max_workers=WARMER_WORKERS, initializer=_lower_priority) as pool:
+                futures = [pool.submit(_warm_thumbnail, source, target) for source, target in missing]
+                for future in as_completed(futures):
+                    with _lock:
+                        if future.exception() is None:
+                            _warmer['done'] += 1
+                        else:
+                            _warmer['failed'] += 1
+        with _lock:
+            _warmer.update(status='done', finishedAt=datetime.now().isoformat())
+    except Exception as e:
+        print(f"Error in thumbnail warmer: {str(e)}")
+        with _lock:
+            _warmer.update(status='failed', finishedAt=datetime.now().isoformat())
+
+
+def start_thumbnail_warmer(resolve):
+    """Generate missing thumbnails in the background, once per process.
+
+    Returns immediately; progress is available from thumbnail_warmer_status.
+    Calling it again after the warmer finished starts a new pass.
+    """
+    global _warmer_thread
+    with _lock:
+        if _warmer_thread is not None and _warmer_thread.is_alive():
+            return False
+        _warmer.update(status='scanning', total=0, done=0, failed=0,
+                       startedAt=datetime.now().isoformat(), finishedAt=None)
+        _warmer_thread = threading.Thread(target=_run_warmer, args=(resolve,), name='thumbnail-warmer', daemon=True)
+        _warmer_thread.start()
+        return True
+
+
+def thumbnail_warmer_status():
+    """Copy of the warmer progress"""
+    with _lock:
+        return dict(_warmer)
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+import pandas as pd
+
+# Parsed frames are spilled here as pickles, which load far faster than xlsx
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads', 'parsed')
+
+# Frames kept in memory / on disk before the least recently used is dropped
+MAX_MEMORY_ENTRIES = 8
+MAX_DISK_ENTRIES = 64
+
+_lock = threading.Lock()
+_frames = OrderedDict()
+
+
+def file_digest(file_path):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_key(digest, dtype):
+    """Cache key for one file content parsed with one set of read options"""
+    if not dtype:
+        return digest
+    options = json.dumps({k: getattr(v, '__name__', str(v)) for k, v in dtype.items()}, sort_keys=True)
+    return f"{digest}_{hashlib.sha256(options.encode('utf-8')).hexdigest()[:8]}"
+
+
+def _prune_disk():
+    """Drop the least recently used spilled frames beyond MAX_DISK_ENTRIES"""
+    entries = [os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR) if name.endswith('.pkl')]
+    entries.sort(key=os.path.getmtime)
+    for path in entries[:-MAX_DISK_ENTRIES]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def read_excel_cached(file_path, dtype=None):
+    """Return the first sheet of an uploaded workbook as a DataFrame.
+
+    Each distinct file content is parsed once: later calls with the same
+    bytes are served from a bounded in-memory LRU or from the on-disk
+    spill, whatever the file is named. Callers get their own copy.
+    """
+    key = _cache_key(file_digest(file_path), dtype)
+
+    with _lock:
+        if key in _frames:
+            _frames.move_to_end(key)
+            return _frames[key].copy()
+
+    spill_path = os.path.join(CACHE_DIR, f"{key}.pkl")
+    if os.path.exists(spill_path):
+        df = pd.read_pickle(spill_path)
+        os.utime(spill_path)
+    else:
+        df = pd.read_excel(file_path, dtype=dtype)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Requests parsing the same content at once each write their own file
+        tmp_path = f"{spill_path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            df.to_pickle(tmp_path)
+            os.replace(tmp_path, spill_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        _prune_disk()
+
+    with _lock:
+        _frames[key] = df
+        _frames.move_to_end(key)
+        while len(_frames) > MAX_MEMORY_ENTRIES:
+            _frames.popitem(last=False)
+
+    return df.copy()
@@ -0,0 +1,100 @@
+from tempfile import SpooledTemporaryFile
+from flask import Request, current_app
+from werkzeug.exceptions import BadRequest
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, File, Field, Data, Epilogue, NeedData
+
+# Uploaded parts stay in memory up to this size, larger ones spill to disk
+DEFAULT_SPOOL_MAX_MEMORY = 1024 * 1024
+
+# Bytes read from the request body per step when streaming multipart parts
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def _spool_max_memory():
+    return current_app.config.get('UPLOAD_SPOOL_MAX_MEMORY', DEFAULT_SPOOL_MAX_MEMORY)
+
+
+class SpooledRequest(Request):
+    """Request whose uploaded files go to spooled temp files.
+
+    Use as app.request_class. Parts above UPLOAD_SPOOL_MAX_MEMORY are
+    written to disk while the body is parsed instead of being held in
+    memory.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledTemporaryFile(max_size=_spool_max_memory(), mode='rb+')
+
+
+class PartTooLarge(Exception):
+    """Raised for an uploaded file that exceeds the per-file size limit"""
+
+
+def iter_uploaded_files(request, fields=None, max_file_size=None):
+    """Yield (field name, filename, file) for each uploaded file as it arrives.
+
+    The multipart body is read straight from the request stream, so the
+    caller can process the first file while the rest is still uploading and
+    only one part is buffered at a time (spooled to disk when large). Plain
+    form fields are stored in the fields dict when one is given.
+
+    A file larger than max_file_size is yielded with a PartTooLarge instance
+    instead of a file. The overall body is limited by MAX_CONTENT_LENGTH,
+    which the request stream enforces.
+    """
+    mimetype, options = parse_options_header(request.headers.get('Content-Type', ''))
+    boundary = options.get('boundary', '').encode('latin-1')
+    if mimetype != 'multipart/form-data' or not boundary:
+        raise BadRequest('Expected a multipart/form-data upload')
+
+    decoder = MultipartDecoder(boundary, max_form_memory_size=_spool_max_memory())
+    stream = request.stream
+    current = None
+    field_data = []
+    size = 0
+    too_large = False
+    body_done = False
+
+    while True:
+        event = decoder.next_event()
+        if isinstance(event, NeedData):
+            if body_done:
+                raise BadRequest('Incomplete multipart upload')
+            chunk = stream.read(READ_CHUNK_SIZE)
+            body_done = not chunk
+            decoder.receive_data(chunk or None)
+            continue
+        if isinstance(event, Epilogue):
+            break
+
+        if isinstance(event, File):
+            current = (event.name, event.filename, SpooledTemporaryFile(max_size=_spool_max_memory(), mode='rb+'))
+            size = 0
+            too_large = False
+        elif isinstance(event, Field):
+            current = (event.name, None, None)
+            field_data = []
+        elif isinstance(event, Data):
+            name, filename, spool = current
+            if spool is None:
+                field_data.append(event.data)
+            elif not too_large:
+                size += len(event.data)
+                if max_file_size and size > max_file_size:
+                    # Keep reading the body but drop the rest of this part
+                    too_large = True
+                    spool.close()
+                else:
+                    spool.write(event.data)
+
+            if not event.more_data:
+                if spool is None:
+                    if fields is not None:
+                        fields[name] = b''.join(field_data).decode('utf-8', 'replace')
+                elif too_large:
+                    yield name, filename, PartTooLarge(f'File exceeds {max_file_size / (1024 * 1024):.1f} MB')
+                else:
+                    spool.seek(0)
+                    yield name, filename, spool
+                current = None